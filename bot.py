@@ -1,16 +1,33 @@
-import json
+import functools
 import logging
 import random
 import re
-import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
 import telebot
+from telebot.apihelper import ApiTelegramException
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 import config
-from edugate import EdugateClient, filter_sections_for_course, group_by_course
+import storage
+from catalog import CatalogCache, CatalogStore
+from delivery import DeliveryQueue
+from digest import DigestBuffer
+from lanes import SlowLane
+from edugate import (
+    CourseIndex,
+    EdugateClient,
+    changed_fields,
+    group_by_course,
+    section_fingerprint,
+)
+from edugate_async import AsyncEdugateClient
+from listings import ListingCache
+from lookups import LookupCoalescer
+from scheduler import CheckScheduler
+from webhook import WebhookServer
 
 log = logging.getLogger("bot")
 
@@ -29,56 +46,40 @@ def _setup_logging():
 _setup_logging()
 
 bot = telebot.TeleBot(config.BOT_TOKEN)
-USERS_FILE = config.USERS_FILE
-_users_lock = threading.Lock()
-edugate = EdugateClient()
+outbox = DeliveryQueue(
+    bot.send_message,
+    rate=config.DELIVERY_RATE,
+    chat_interval=config.DELIVERY_CHAT_INTERVAL,
+    workers=config.DELIVERY_WORKERS,
+)
+users_store = storage.open_registry()
+catalog = CatalogStore(config.CATALOG_DIR, keep=config.CATALOG_DELTAS)
+edugate = AsyncEdugateClient() if config.EDUGATE_CLIENT == "async" else EdugateClient()
+lookups = LookupCoalescer(edugate, config.LOOKUP_TTL)
+catalog_cache = CatalogCache(
+    lambda force: edugate.fetch_catalog(force=force),
+    catalog,
+    config.CATALOG_TTL,
+    stale=config.CATALOG_SWR,
+)
+slow_lane = SlowLane(config.SLOW_WORKERS, config.SLOW_QUEUE)
 _last_manual_check = {}
 
 
-def _without_secrets(user_data):
-    return {k: v for k, v in user_data.items() if k not in ("username", "password")}
-
-
-def load_users():
-    try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            users = json.load(f)
-    except FileNotFoundError:
-        return {}
-    return {uid: _without_secrets(data) for uid, data in users.items()}
-
-
-def save_users(users):
-    cleaned = {uid: _without_secrets(data) for uid, data in users.items()}
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(cleaned, f, ensure_ascii=False, indent=2)
-
-
 def all_users():
-    with _users_lock:
-        return load_users()
+    return users_store.all()
 
 
 def get_user(chat_id):
-    with _users_lock:
-        return load_users().get(str(chat_id))
+    return users_store.get(chat_id)
 
 
 def save_user(chat_id, user_data):
-    with _users_lock:
-        users = load_users()
-        users[str(chat_id)] = user_data
-        save_users(users)
+    users_store.save(chat_id, user_data)
 
 
 def delete_user(chat_id):
-    with _users_lock:
-        users = load_users()
-        if str(chat_id) not in users:
-            return False
-        del users[str(chat_id)]
-        save_users(users)
-        return True
+    return users_store.delete(chat_id)
 
 
 def is_admin(chat_id):
@@ -90,11 +91,9 @@ def md(text):
 
 
 def send_long(chat_id, msg):
-    if len(msg) > 4000:
-        for i in range(0, len(msg), 4000):
-            bot.send_message(chat_id, msg[i : i + 4000], parse_mode="Markdown")
-    else:
-        bot.send_message(chat_id, msg, parse_mode="Markdown")
+    """Queue msg for chat_id, in 4000-character parts; returns before it is sent."""
+    for i in range(0, len(msg), 4000):
+        outbox.enqueue(chat_id, msg[i : i + 4000], parse_mode="Markdown")
 
 
 def _section_line(sec):
@@ -111,6 +110,32 @@ def _section_line(sec):
     )
 
 
+def _course_heading(code, name):
+    return f"📚 *{md(code)}* - {md(name)}\n"
+
+
+listings = ListingCache(_section_line, _course_heading)
+
+_FIELD_LABELS = {
+    "course_code": "الرمز",
+    "course_name": "اسم المقرر",
+    "section_num": "رقم الشعبة",
+    "activity": "النشاط",
+    "time": "الوقت",
+    "doctor": "المحاضر",
+    "group": "الفئة",
+}
+
+
+def _change_lines(old, new):
+    lines = ""
+    for field in changed_fields(old, new):
+        before = old.get(field) or "—"
+        after = new.get(field) or "—"
+        lines += f"      ↳ {_FIELD_LABELS[field]}: {md(after)} (كان: {md(before)})\n"
+    return lines
+
+
 def _edugate_user_error(error):
     err = str(error)
     if err in {
@@ -134,25 +159,50 @@ def _notify_busy_once():
     wait = edugate.backoff_remaining()
     if not wait or not edugate.consume_busy_alert():
         return
-    for uid in load_users():
-        try:
-            bot.send_message(
-                int(uid),
-                f"⚠️ إيدوجيت لا يستجيب. سأعيد المحاولة بعد {wait} ثانية.",
-            )
-        except Exception:
-            pass
+    for uid in all_users():
+        outbox.enqueue(int(uid), f"⚠️ إيدوجيت لا يستجيب. سأعيد المحاولة بعد {wait} ثانية.")
 
 
-def _catalog_snapshot(force=False):
-    sections, error = edugate.fetch_catalog(force=force)
+def _catalog_snapshot(force=False, stale_ok=False):
+    """Return (version, sections, error); sections are shared, never edit them."""
+    version, sections, error = catalog_cache.get(force=force, stale_ok=stale_ok)
     if error and str(error).startswith("busy_backoff:"):
         _notify_busy_once()
-        return None, error
-    return sections, error
+        return None, None, error
+    return version, sections, error
 
 
-def check_user_sections(chat_id, notify_errors=True, force=False):
+def _section_for_key(key, *sources):
+    for source in sources:
+        sec = (source or {}).get(key)
+        if sec:
+            return sec
+    course_id, _, section_id = key.partition("_")
+    return {"course_id": course_id, "section_id": section_id or key}
+
+
+def _upgrade_legacy_users():
+    """Move per-chat catalog copies into the shared catalog store (one-time)."""
+    upgraded = 0
+    for uid in all_users():
+        user = get_user(uid)
+        if not user:
+            continue
+        snapshots = user.get("course_snapshots") or {}
+        legacy_snapshots = any(isinstance(v, dict) for v in snapshots.values())
+        if "sections" not in user and not legacy_snapshots:
+            continue
+        sections = user.pop("sections", None)
+        if sections:
+            user["catalog_version"] = catalog.put(sections)
+        user["course_snapshots"] = {key: sorted(matched or ()) for key, matched in snapshots.items()}
+        save_user(uid, user)
+        upgraded += 1
+    if upgraded:
+        log.info("upgrade  chats=%s moved to shared catalog", upgraded)
+
+
+def check_user_sections(chat_id, notify_errors=True, force=False, snapshot=None):
     user = get_user(chat_id)
     if not user:
         return False
@@ -160,7 +210,9 @@ def check_user_sections(chat_id, notify_errors=True, force=False):
     watches = user.get("watches") or {}
     course_watches = user.get("course_watches") or []
     if course_watches:
-        course_ok = _check_course_watches(chat_id, user, course_watches, force=force)
+        course_ok = _check_course_watches(
+            chat_id, user, course_watches, force=force, snapshot=snapshot
+        )
         watch_ok = True
         if watches:
             watch_ok = _check_watches(chat_id, user, watches)
@@ -170,22 +222,29 @@ def check_user_sections(chat_id, notify_errors=True, force=False):
 
     t0 = time.time()
     log.info("check catalog  chat=%s", chat_id)
-    current, error = _catalog_snapshot(force=force)
+    version, current, error = snapshot or _catalog_snapshot(force=force)
     if error:
         if str(error).startswith("busy_backoff:"):
             log.info("check skip  chat=%s reason=backoff wait=%ss", chat_id, error.split(":", 1)[1])
         else:
             log.error("check fail  chat=%s error=%s", chat_id, error)
         if notify_errors and not str(error).startswith("busy_backoff:"):
-            try:
-                bot.send_message(chat_id, _edugate_user_error(error), parse_mode="Markdown")
-            except Exception:
-                pass
+            outbox.enqueue(chat_id, _edugate_user_error(error), parse_mode="Markdown")
         return False
 
-    saved = user.get("sections", {})
-    new_sections = [sec for key, sec in current.items() if key not in saved]
-    removed_sections = [sec for key, sec in saved.items() if key not in current]
+    cursor = user.get("catalog_version")
+    if cursor and version < cursor:
+        # An older snapshot (cycle tick, stale cache) after /check moved the
+        # cursor on: diffing would resync backwards and replay seen deltas.
+        log.info("check skip  chat=%s reason=stale snapshot=v%s cursor=v%s", chat_id, version, cursor)
+        return True
+    changes = catalog.changes(cursor, version)
+    if changes is None:
+        log.info("check resync  chat=%s cursor=v%s adopt=v%s", chat_id, cursor, version)
+        changes = {"added": {}, "removed": {}, "changed": {}}
+    new_sections = list(changes["added"].values())
+    removed_sections = list(changes["removed"].values())
+    changed_sections = list(changes["changed"].values())
 
     user["total_checks"] = user.get("total_checks", 0) + 1
     user["last_check"] = datetime.now().isoformat()
@@ -193,47 +252,162 @@ def check_user_sections(chat_id, notify_errors=True, force=False):
         user["total_new"] = user.get("total_new", 0) + len(new_sections)
     if removed_sections:
         user["total_removed"] = user.get("total_removed", 0) + len(removed_sections)
+    if changed_sections:
+        user["total_changed"] = user.get("total_changed", 0) + len(changed_sections)
 
-    if new_sections:
-        _send_section_group(chat_id, "🆕 *شعب جديدة متاحة!*\n\n", new_sections)
-    if removed_sections:
-        _send_section_group(chat_id, "❌ *شعب لم تعد متاحة (ممتلئة):*\n\n", removed_sections)
+    _notify_sections(chat_id, user, "catalog", new_sections, removed_sections, changed_sections)
 
     log.info(
-        "check ok  chat=%s sections=%s new=%s gone=%s ms=%s",
+        "check ok  chat=%s sections=%s new=%s gone=%s changed=%s ms=%s",
         chat_id,
         len(current),
         len(new_sections),
         len(removed_sections),
+        len(changed_sections),
         int((time.time() - t0) * 1000),
     )
-    user["sections"] = current
+    user["catalog_version"] = version
     save_user(chat_id, user)
     return True
 
 
-def _send_section_group(chat_id, header, sections_list):
-    msg = header
+def _section_group_text(sections_list):
+    msg = ""
     grouped = group_by_course(sections_list)
     for code, info in sorted(grouped.items()):
-        msg += f"📚 *{md(code)}* - {md(info['name'])}\n"
+        msg += _course_heading(code, info["name"])
         for sec in info["sections"]:
             msg += _section_line(sec)
         msg += "\n"
-    try:
-        send_long(chat_id, msg)
-    except Exception as exc:
-        log.error("telegram send fail  chat=%s error=%s", chat_id, type(exc).__name__)
+    return msg
+
+
+def _changed_group_text(pairs):
+    """pairs are [old, new] versions of the same section."""
+    msg = ""
+    grouped = group_by_course([new for _old, new in pairs])
+    before = {id(new): old for old, new in pairs}
+    for code, info in sorted(grouped.items()):
+        msg += _course_heading(code, info["name"])
+        for sec in info["sections"]:
+            msg += _section_line(sec) + _change_lines(before[id(sec)], sec)
+        msg += "\n"
+    return msg
+
+
+# Headers for (added, removed, changed) by where the change was seen.
+_NOTIFY_HEADERS = {
+    "catalog": (
+        "🆕 *شعب جديدة متاحة!*",
+        "❌ *شعب لم تعد متاحة (ممتلئة):*",
+        "✏️ *تغيّرت بيانات شعب:*",
+    ),
+    "course": (
+        "🆕 *شعب جديدة للمقرر الذي تراقبه!*",
+        "❌ *شعب اختفت من المقرر الذي تراقبه:*",
+        "✏️ *تغيّرت بيانات شعب في المقرر الذي تراقبه:*",
+    ),
+    "watch": (
+        "🆕 *شعبة في قائمتك أصبحت متاحة!*",
+        "❌ *شعبة في قائمتك لم تعد متاحة:*",
+        "✏️ *تغيّرت بيانات شعبة في قائمتك:*",
+    ),
+    "digest": (
+        "🆕 *أصبحت متاحة:*",
+        "❌ *لم تعد متاحة:*",
+        "✏️ *تغيّرت بياناتها:*",
+    ),
+}
+
+
+def _digest_key(scope, sec):
+    return (scope, str(sec.get("course_id") or ""), str(sec.get("section_id") or ""))
+
+
+def _notify_sections(chat_id, user, scope, added, removed, changed):
+    """Send added / removed sections and [old, new] pairs now, or hold them for the
+    chat's digest when it has a window set."""
+    if not (added or removed or changed):
+        return
+    window = user.get("digest_window", config.DIGEST_WINDOW)
+    if window:
+        first = False
+        for sec in added:
+            first |= digests.add(chat_id, _digest_key(scope, sec), None, sec)
+        for sec in removed:
+            first |= digests.add(chat_id, _digest_key(scope, sec), sec, None)
+        for old, new in changed:
+            first |= digests.add(chat_id, _digest_key(scope, new), old, new)
+        digests.save()
+        if first or not digest_timer.pending(chat_id):
+            digest_timer.schedule(chat_id, window)
+        log.info("digest hold  chat=%s events=%s", chat_id, digests.pending(chat_id))
+        return
+    headers = _NOTIFY_HEADERS[scope]
+    if added:
+        send_long(chat_id, f"{headers[0]}\n\n{_section_group_text(added)}")
+    if removed:
+        send_long(chat_id, f"{headers[1]}\n\n{_section_group_text(removed)}")
+    if changed:
+        send_long(chat_id, f"{headers[2]}\n\n{_changed_group_text(changed)}")
+
+
+def _flush_digest(chat_id):
+    """Send the chat's held events as one message, net of flips inside the window."""
+    held = digests.pending(chat_id)
+    added, removed, changed = digests.take(chat_id)
+    log.info(
+        "digest flush  chat=%s events=%s new=%s gone=%s changed=%s",
+        chat_id,
+        held,
+        len(added),
+        len(removed),
+        len(changed),
+    )
+    if not (added or removed or changed):
+        digests.save()
+        return
+    user = get_user(chat_id) or {}
+    minutes = user.get("digest_window", config.DIGEST_WINDOW) // 60
+    headers = _NOTIFY_HEADERS["digest"]
+    span = f" (آخر {minutes} دقيقة)" if minutes else ""
+    msg = f"🗞 *ملخص التغييرات{span}:*\n\n"
+    if added:
+        msg += f"{headers[0]}\n{_section_group_text(added)}"
+    if removed:
+        msg += f"{headers[1]}\n{_section_group_text(removed)}"
+    if changed:
+        msg += f"{headers[2]}\n{_changed_group_text(changed)}"
+    send_long(chat_id, msg)
+    digests.save()
+
+
+def _resume_digests(users):
+    """Re-arm digests held before a restart for the rest of their window."""
+    now = time.time()
+    for chat_id, since in digests.held().items():
+        user = users.get(str(chat_id))
+        if user is None:
+            digests.discard(chat_id)
+            continue
+        window = user.get("digest_window", config.DIGEST_WINDOW)
+        digest_timer.schedule(chat_id, max(FIRST_CHECK_DELAY, since + window - now))
+        log.info("digest resume  chat=%s events=%s", chat_id, digests.pending(chat_id))
+
+
+def _course_index(version, sections):
+    """The shared index for a stored version; a throwaway one if it is gone."""
+    return catalog.index(version) or CourseIndex(sections)
 
 
 def _course_watch_key(query):
     return re.sub(r"\s+", " ", str(query or "").strip()).lower()
 
 
-def _check_course_watches(chat_id, user, course_watches, force=False):
+def _check_course_watches(chat_id, user, course_watches, force=False, snapshot=None):
     t0 = time.time()
     log.info("check courses  chat=%s count=%s", chat_id, len(course_watches))
-    current, error = _catalog_snapshot(force=force)
+    version, current, error = snapshot or _catalog_snapshot(force=force)
     if error:
         if str(error).startswith("busy_backoff:"):
             log.info("check skip  chat=%s reason=backoff wait=%ss", chat_id, error.split(":", 1)[1])
@@ -242,36 +416,70 @@ def _check_course_watches(chat_id, user, course_watches, force=False):
         return False
 
     snapshots = user.get("course_snapshots") or {}
+    # course_version is the catalog version the key lists were taken from;
+    # catalog_version can move without them (/sections).
+    course_version = user.get("course_version")
+    if course_version and version < course_version:
+        log.info(
+            "check skip  chat=%s reason=stale snapshot=v%s cursor=v%s", chat_id, version, course_version
+        )
+        return True
+    recent = None
+    index = _course_index(version, current)
     new_sections = []
     removed_sections = []
+    changed_sections = {}
     next_snapshots = {}
     for query in course_watches:
         key = _course_watch_key(query)
-        matched = filter_sections_for_course(current, query)
-        next_snapshots[key] = matched
-        prev = snapshots.get(key) or {}
+        matched = index.lookup(key)
+        next_snapshots[key] = sorted(matched)
+        prev = snapshots.get(key)
         if not prev:
             continue
-        new_sections.extend(sec for item, sec in matched.items() if item not in prev)
-        removed_sections.extend(sec for item, sec in prev.items() if item not in matched)
+        delta = catalog.course_delta(course_version, version, key) if course_version else None
+        if delta is None:
+            prev = set(prev)
+            added = matched - prev
+            if recent is None:
+                recent = catalog.changes(course_version or user.get("catalog_version"), version)
+                recent = recent or {}
+            removed = {
+                item: _section_for_key(item, recent.get("removed"))
+                for item in prev - matched
+            }
+            changed = {
+                item: pair
+                for item, pair in (recent.get("changed") or {}).items()
+                if item in matched and item in prev
+            }
+        else:
+            added, removed, changed = delta
+        new_sections.extend(current[item] for item in sorted(added))
+        removed_sections.extend(removed[item] for item in sorted(removed))
+        changed_sections.update(changed)
+    changed_pairs = [changed_sections[item] for item in sorted(changed_sections)]
 
     user["course_snapshots"] = next_snapshots
-    user["sections"] = current
+    user["course_version"] = version
+    user["catalog_version"] = max(version, user.get("catalog_version") or 0)
     user["total_checks"] = user.get("total_checks", 0) + 1
     user["last_check"] = datetime.now().isoformat()
     if new_sections:
         user["total_new"] = user.get("total_new", 0) + len(new_sections)
-        _send_section_group(chat_id, "🆕 *شعب جديدة للمقرر الذي تراقبه!*\n\n", new_sections)
     if removed_sections:
         user["total_removed"] = user.get("total_removed", 0) + len(removed_sections)
-        _send_section_group(chat_id, "❌ *شعب اختفت من المقرر الذي تراقبه:*\n\n", removed_sections)
+    if changed_pairs:
+        user["total_changed"] = user.get("total_changed", 0) + len(changed_pairs)
+    _notify_sections(chat_id, user, "course", new_sections, removed_sections, changed_pairs)
 
     save_user(chat_id, user)
     log.info(
-        "check courses done  chat=%s new=%s gone=%s ms=%s",
+        "check courses done  chat=%s new=%s gone=%s changed=%s ms=%s",
         chat_id,
         len(new_sections),
         len(removed_sections),
+        len(changed_sections),
         int((time.time() - t0) * 1000),
     )
     return True
@@ -282,10 +490,12 @@ def _check_watches(chat_id, user, watches):
     log.info("check watches  chat=%s count=%s", chat_id, len(watches))
     opened = []
     closed = []
+    edited = []
     ok = True
 
+    results = lookups.lookup_many(list(watches))
     for section_id, saved in list(watches.items()):
-        result = edugate.lookup_section(section_id)
+        result = results[str(section_id).strip()]
         status = result.get("status")
         if status == "busy":
             _notify_busy_once()
@@ -300,6 +510,8 @@ def _check_watches(chat_id, user, watches):
         merged = {**saved, **{k: v for k, v in result.items() if v}}
         merged["status"] = status
         merged["last_seen"] = datetime.now().isoformat()
+        merged.pop("fingerprint", None)
+        merged["fingerprint"] = section_fingerprint(merged)
         watches[section_id] = merged
 
         became_open = status == "open" and prev != "open" and prev != "unknown"
@@ -308,22 +520,32 @@ def _check_watches(chat_id, user, watches):
             opened.append(merged)
         if became_closed:
             closed.append(merged)
+        # Watches saved before fingerprints existed get one now and compare next time.
+        if (
+            status == "open"
+            and prev == "open"
+            and saved.get("fingerprint")
+            and saved["fingerprint"] != merged["fingerprint"]
+        ):
+            edited.append([saved, merged])
 
     user["watches"] = watches
     user["total_checks"] = user.get("total_checks", 0) + 1
     user["last_check"] = datetime.now().isoformat()
     if opened:
         user["total_new"] = user.get("total_new", 0) + len(opened)
-        _send_section_group(chat_id, "🆕 *شعبة في قائمتك أصبحت متاحة!*\n\n", opened)
     if closed:
         user["total_removed"] = user.get("total_removed", 0) + len(closed)
-        _send_section_group(chat_id, "❌ *شعبة في قائمتك لم تعد متاحة:*\n\n", closed)
+    if edited:
+        user["total_changed"] = user.get("total_changed", 0) + len(edited)
+    _notify_sections(chat_id, user, "watch", opened, closed, edited)
     save_user(chat_id, user)
     log.info(
-        "check watches done  chat=%s opened=%s closed=%s ok=%s ms=%s",
+        "check watches done  chat=%s opened=%s closed=%s changed=%s ok=%s ms=%s",
         chat_id,
         len(opened),
         len(closed),
+        len(edited),
         ok,
         int((time.time() - t0) * 1000),
     )
@@ -343,31 +565,110 @@ def random_offset(jitter):
     return random.randint(-jitter, jitter)
 
 
-def scheduler():
-    next_check_at = {}
-    while True:
-        users = all_users()
-        now = time.time()
-        soonest = None
-        for chat_id_str, user_data in users.items():
-            chat_id = int(chat_id_str)
-            base_interval = user_data.get("check_interval", config.DEFAULT_CHECK_INTERVAL)
-            if chat_id not in next_check_at:
-                next_check_at[chat_id] = now + 8
-                log.info("scheduler  chat=%s first check in 8s", chat_id)
-            due = next_check_at[chat_id]
-            if now >= due:
-                try:
-                    check_user_sections(chat_id, notify_errors=False)
-                except Exception as exc:
-                    log.exception("check crash  chat=%s", chat_id)
-                next_check_at[chat_id] = time.time() + _next_interval(base_interval)
-                time.sleep(1)
-            remaining = next_check_at.get(chat_id, now) - time.time()
-            if soonest is None or remaining < soonest:
-                soonest = remaining
-        sleep_for = 5 if soonest is None else max(1, min(soonest, 5))
-        time.sleep(sleep_for)
+FIRST_CHECK_DELAY = 8
+
+
+def _cycle_key(interval):
+    return f"cycle:{interval}"
+
+
+def _cycle_members(interval, users):
+    return [
+        int(uid)
+        for uid, data in users.items()
+        if data.get("check_interval", config.DEFAULT_CHECK_INTERVAL) == interval
+    ]
+
+
+def _run_cycle(interval):
+    """One catalog fetch for every chat on this interval, then a diff per chat."""
+    t0 = time.time()
+    users = all_users()
+    members = _cycle_members(interval, users)
+    needs_catalog = any(
+        users[str(chat_id)].get("course_watches") or not users[str(chat_id)].get("watches")
+        for chat_id in members
+    )
+    snapshot = _catalog_snapshot() if needs_catalog else None
+    for chat_id in members:
+        try:
+            check_user_sections(chat_id, notify_errors=False, snapshot=snapshot)
+        except Exception:
+            log.exception("check crash  chat=%s", chat_id)
+    log.info(
+        "cycle done  interval=%sm chats=%s fetched=%s ms=%s",
+        interval // 60,
+        len(members),
+        "yes" if snapshot else "no",
+        int((time.time() - t0) * 1000),
+    )
+
+
+def _scheduled_check(key):
+    if config.CHECK_MODE == "cycle":
+        _run_cycle(int(str(key).split(":", 1)[1]))
+    else:
+        check_user_sections(key, notify_errors=False)
+
+
+def _next_check_delay(key):
+    """Jitter applies to the chat's timer, or to the shared tick in cycle mode."""
+    if config.CHECK_MODE == "cycle":
+        interval = int(str(key).split(":", 1)[1])
+        return _next_interval(interval) if _cycle_members(interval, all_users()) else None
+    user = get_user(key)
+    if not user:
+        return None
+    return _next_interval(user.get("check_interval", config.DEFAULT_CHECK_INTERVAL))
+
+
+def _schedule_chat(chat_id, interval, delay):
+    """Per-chat mode: (re)time the chat. Cycle mode: make sure its bucket ticks."""
+    if config.CHECK_MODE == "cycle":
+        key = _cycle_key(interval)
+        if not check_scheduler.pending(key):
+            check_scheduler.schedule(key, delay)
+    else:
+        check_scheduler.schedule(int(chat_id), delay)
+
+
+def _delay_after_interval_change(user, interval):
+    """Seconds until last_check + interval, so a new interval applies right away."""
+    try:
+        last = datetime.fromisoformat(user["last_check"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return _next_interval(interval)
+    return max(1, last + interval - time.time())
+
+
+check_scheduler = CheckScheduler(_scheduled_check, _next_check_delay)
+# Digests fire once per window; the timer drops the chat after each flush.
+digests = DigestBuffer(config.DIGEST_FILE)
+digest_timer = CheckScheduler(_flush_digest, lambda chat_id: None, name="digest")
+MAX_DIGEST_MINUTES = 240
+
+
+def slow_command(handler):
+    """Queue the handler on the slow lane; the Telegram thread returns at once."""
+
+    @functools.wraps(handler)
+    def queued(message):
+        result = slow_lane.submit(message.chat.id, handler, message)
+        log.info(
+            "slow lane  chat=%s cmd=%s status=%s position=%s",
+            message.chat.id,
+            handler.__name__,
+            result["status"],
+            result.get("position", "-"),
+        )
+        if result["status"] == "full":
+            bot.reply_to(message, "⚠️ البوت مشغول الآن بطلبات كثيرة. حاول بعد دقيقة.")
+        elif result["status"] == "duplicate":
+            bot.reply_to(message, "⏳ طلبك السابق ما زال قيد التنفيذ، انتظر النتيجة.")
+        elif result["position"]:
+            bot.reply_to(message, f"⏳ طلبك في الطابور، قبلك {result['position']}.")
+
+    return queued
 
 
 def _require_user(message):
@@ -379,6 +680,7 @@ def _require_user(message):
 
 
 @bot.message_handler(commands=["start"])
+@slow_command
 def cmd_start(message):
     chat_id = message.chat.id
     user = get_user(chat_id)
@@ -390,7 +692,7 @@ def cmd_start(message):
         bot.reply_to(
             message,
             f"👋 مرحباً! أنت مسجل بالفعل.\n\n"
-            f"📊 الشعب المحفوظة: {len(user.get('sections', {}))}\n"
+            f"📊 الشعب المحفوظة: {catalog.count(user.get('catalog_version'))}\n"
             f"👀 المراقبة: {len(watches)} شعبة · {len(course_watches)} مقرر\n"
             f"⏰ الفحص كل: {interval_mins} دقيقة\n\n"
             f"أرسل /help لعرض الأوامر",
@@ -399,7 +701,7 @@ def cmd_start(message):
         return
 
     bot.reply_to(message, "🔄 جاري التحقق من حساب إيدوجيت...")
-    sections, error = _catalog_snapshot()
+    version, sections, error = _catalog_snapshot()
     if error:
         bot.send_message(chat_id, _edugate_user_error(error), parse_mode="Markdown")
         return
@@ -407,7 +709,7 @@ def cmd_start(message):
     save_user(
         chat_id,
         {
-            "sections": sections,
+            "catalog_version": version,
             "watches": {},
             "course_watches": [],
             "course_snapshots": {},
@@ -416,8 +718,10 @@ def cmd_start(message):
             "total_checks": 0,
             "total_new": 0,
             "total_removed": 0,
+            "total_changed": 0,
         },
     )
+    _schedule_chat(chat_id, config.DEFAULT_CHECK_INTERVAL, FIRST_CHECK_DELAY)
     bot.send_message(
         chat_id,
         f"✅ *تم التسجيل بنجاح!*\n\n"
@@ -454,6 +758,8 @@ def cmd_help(message):
 *الإعدادات:*
 /interval `[دقائق]` - تغيير وقت الفحص
    مثال: `/interval 30`
+/digest `[دقائق]` - اجمع التنبيهات في ملخص واحد
+   مثال: `/digest 30` · `/digest 0` للإيقاف
 
 *كيف يعمل:*
 • بدون مراقبة يُقارن كتالوج الشعب كلها
@@ -471,6 +777,7 @@ def cmd_help(message):
 
 
 @bot.message_handler(commands=["check"])
+@slow_command
 def cmd_check(message):
     user = _require_user(message)
     if not user:
@@ -485,46 +792,107 @@ def cmd_check(message):
     log.info("cmd /check  chat=%s", chat_id)
     bot.reply_to(message, "🔍 جاري الفحص...")
     if check_user_sections(chat_id, notify_errors=True, force=True):
-        bot.send_message(chat_id, "✅ تم الفحص!")
+        outbox.enqueue(chat_id, "✅ تم الفحص!")
     else:
-        bot.send_message(chat_id, "⚠️ لم يكتمل الفحص. حاول لاحقاً.")
+        outbox.enqueue(chat_id, "⚠️ لم يكتمل الفحص. حاول لاحقاً.")
 
 
 @bot.message_handler(commands=["sections"])
+@slow_command
 def cmd_sections(message):
     user = _require_user(message)
     if not user:
         return
-    query = " ".join(message.text.split()[1:]).strip()
+    query = _course_watch_key(" ".join(message.text.split()[1:]))
     bot.reply_to(message, "📥 جاري جلب الشعب...")
-    sections, error = _catalog_snapshot()
+    version, sections, error = _catalog_snapshot(stale_ok=True)
     if error:
         bot.send_message(message.chat.id, _edugate_user_error(error), parse_mode="Markdown")
         return
-    user["sections"] = sections
-    save_user(message.chat.id, user)
-    if query:
-        sections = filter_sections_for_course(sections, query)
-        if not sections:
-            bot.send_message(
-                message.chat.id,
-                f"لا توجد شعب ظاهرة الآن للمقرر `{md(query)}`.\n"
-                f"للمراقبة لاحقاً: `/course {md(query)}`",
-                parse_mode="Markdown",
-            )
-            return
-    courses = group_by_course(list(sections.values()))
-    title = f"المقرر {query}" if query else "الشعب المتاحة"
-    msg = f"📊 *{md(title)} ({len(sections)} شعبة):*\n\n"
-    for code, info in sorted(courses.items()):
-        msg += f"📚 *{md(code)}* - {md(info['name'])}\n"
-        for sec in info["sections"]:
-            msg += _section_line(sec)
-        msg += "\n"
-    send_long(message.chat.id, msg)
+    # A stale answer may be older than the chat's baseline; never move it back.
+    if version > (user.get("catalog_version") or 0):
+        user["catalog_version"] = version
+        save_user(message.chat.id, user)
+    index = _course_index(version, sections) if query else None
+    listing = listings.get(version, sections, query, index)
+    if query and not listing.count:
+        bot.send_message(
+            message.chat.id,
+            f"لا توجد شعب ظاهرة الآن للمقرر `{md(query)}`.\n"
+            f"للمراقبة لاحقاً: `/course {md(query)}`",
+            parse_mode="Markdown",
+        )
+        return
+    text, markup = _sections_page(listing, 0)
+    outbox.enqueue(message.chat.id, text, parse_mode="Markdown", reply_markup=markup)
+
+
+def _sections_header(listing):
+    title = f"المقرر {listing.query}" if listing.query else "الشعب المتاحة"
+    return f"📊 *{md(title)} ({listing.count} شعبة):*\n"
+
+
+def _sections_callback(page, query):
+    """Button data for a page. A query too long for Telegram's 64 bytes (or one
+    that looks like a reference) is sent as "#" plus its listings.ref token."""
+    data = f"sections:{page}:{query}"
+    if len(data.encode("utf-8")) <= 64 and not query.startswith("#"):
+        return data
+    return f"sections:{page}:#{listings.ref(query)}"
+
+
+def _sections_page(listing, page):
+    """(text, keyboard) for one page of a /sections listing; no keyboard for one page."""
+    pages = listing.pages()
+    page = max(0, min(page, len(pages) - 1))
+    if len(pages) == 1:
+        return _sections_header(listing) + "\n" + pages[0], None
+    text = f"{_sections_header(listing)}صفحة {page + 1}/{len(pages)}\n\n{pages[page]}"
+    last = len(pages) - 1
+    targets = []
+    if page > 1:
+        targets.append(("⏮", 0))
+    if page > 0:
+        targets.append(("◀️ السابق", page - 1))
+    if page < last:
+        targets.append(("التالي ▶️", page + 1))
+    if page < last - 1:
+        targets.append(("⏭", last))
+    buttons = [
+        InlineKeyboardButton(label, callback_data=_sections_callback(target, listing.query))
+        for label, target in targets
+    ]
+    return text, InlineKeyboardMarkup().row(*buttons)
+
+
+@bot.callback_query_handler(func=lambda call: (call.data or "").startswith("sections:"))
+def cb_sections_page(call):
+    """Page buttons read the stored latest snapshot; they never fetch from Edugate."""
+    _, page, query = call.data.split(":", 2)
+    if query.startswith("#"):
+        query = listings.query(query[1:])
+    version, sections = catalog.latest()
+    if sections is None or query is None:
+        bot.answer_callback_query(call.id, "أرسل /sections مرة أخرى")
+        return
+    index = _course_index(version, sections) if query else None
+    text, markup = _sections_page(listings.get(version, sections, query, index), int(page))
+    try:
+        bot.edit_message_text(
+            text,
+            call.message.chat.id,
+            call.message.message_id,
+            parse_mode="Markdown",
+            reply_markup=markup,
+        )
+    except ApiTelegramException as exc:
+        if "message is not modified" not in str(exc.description):
+            log.error("sections page fail  chat=%s error=%s", call.message.chat.id, exc.description)
+    bot.answer_callback_query(call.id)
 
 
 @bot.message_handler(commands=["watch"])
+@slow_command
 def cmd_watch(message):
     user = _require_user(message)
     if not user:
@@ -566,8 +934,10 @@ def cmd_watch(message):
             "doctor": result.get("doctor") or "",
             "time": result.get("time") or "",
             "activity": result.get("activity") or "",
+            "group": result.get("group") or "",
             "last_seen": datetime.now().isoformat(),
         }
+        watches[raw]["fingerprint"] = section_fingerprint(watches[raw])
         added.append(watches[raw])
     user["watches"] = watches
     save_user(message.chat.id, user)
@@ -636,6 +1006,7 @@ def _existing_course_watch(course_watches, query):
 
 
 @bot.message_handler(commands=["course"])
+@slow_command
 def cmd_course(message):
     user = _require_user(message)
     if not user:
@@ -649,13 +1020,14 @@ def cmd_course(message):
         )
         return
     bot.reply_to(message, "📥 جاري البحث عن شعب المقرر...")
-    sections, error = _catalog_snapshot(force=True)
+    version, sections, error = _catalog_snapshot(force=True)
     if error:
         bot.send_message(message.chat.id, _edugate_user_error(error), parse_mode="Markdown")
         return
 
     course_watches = list(user.get("course_watches") or [])
     snapshots = dict(user.get("course_snapshots") or {})
+    index = _course_index(version, sections)
     added = []
     for raw in queries:
         if _existing_course_watch(course_watches, raw):
@@ -663,14 +1035,20 @@ def cmd_course(message):
         if len(course_watches) >= config.MAX_WATCHES:
             bot.reply_to(message, f"⚠️ الحد الأقصى {config.MAX_WATCHES} مقرر")
             return
-        matched = filter_sections_for_course(sections, raw)
+        matched = index.filter(sections, raw)
         course_watches.append(raw.strip())
-        snapshots[_course_watch_key(raw)] = matched
+        snapshots[_course_watch_key(raw)] = sorted(matched)
         added.append((raw.strip(), matched))
 
+    if added:
+        if not user.get("course_snapshots"):
+            user["course_version"] = version
+        elif user.get("course_version") != version:
+            # Key lists now come from two versions; the next check diffs them one by one.
+            user.pop("course_version", None)
     user["course_watches"] = course_watches
     user["course_snapshots"] = snapshots
-    user["sections"] = sections
+    user["catalog_version"] = version
     save_user(message.chat.id, user)
     if not added:
         bot.reply_to(message, "هذا المقرر مُراقب مسبقاً.")
@@ -728,7 +1106,7 @@ def cmd_courses(message):
         return
     msg = f"📚 *المقررات المُراقبة ({len(course_watches)}):*\n\n"
     for query in course_watches:
-        matched = snapshots.get(_course_watch_key(query)) or {}
+        matched = snapshots.get(_course_watch_key(query)) or []
         msg += f"• `{md(query)}` — {len(matched)} شعبة في آخر فحص\n"
     send_long(message.chat.id, msg)
 
@@ -749,7 +1127,7 @@ def cmd_stats(message):
     course_watches = user.get("course_watches") or []
     msg = f"""📈 *إحصائياتك:*
 
-📊 الشعب في آخر لقطة: {len(user.get('sections', {}))}
+📊 الشعب في آخر لقطة: {catalog.count(user.get('catalog_version'))}
 👀 المراقبة: {len(watches)} شعبة · {len(course_watches)} مقرر
 
 ⏰ الفحص كل: {interval_mins} دقيقة
@@ -758,6 +1136,7 @@ def cmd_stats(message):
 
 🆕 فتحات مكتشفة: {user.get('total_new', 0)}
 ❌ امتلاءات: {user.get('total_removed', 0)}
+✏️ تغييرات: {user.get('total_changed', 0)}
 """
     bot.send_message(message.chat.id, msg, parse_mode="Markdown")
 
@@ -768,15 +1147,19 @@ def cmd_settings(message):
     if not user:
         return
     interval_mins = user.get("check_interval", config.DEFAULT_CHECK_INTERVAL) // 60
+    digest_mins = user.get("digest_window", config.DIGEST_WINDOW) // 60
     watches = user.get("watches") or {}
     course_watches = user.get("course_watches") or []
+    digest = f"كل {digest_mins} دقيقة" if digest_mins else "متوقف"
     msg = f"""⚙️ *إعداداتك:*
 
 ⏰ وقت الفحص: كل {interval_mins} دقيقة
+🗞 الملخص: {digest}
 👀 الشعب: {len(watches)} / {config.MAX_WATCHES}
 📚 المقررات: {len(course_watches)} / {config.MAX_WATCHES}
 
 `/interval [دقائق]`
+`/digest [دقائق]`
 `/watch [معرف]`
 `/course [رمز]`
 """
@@ -803,12 +1186,52 @@ def cmd_interval(message):
         return
     user["check_interval"] = minutes * 60
     save_user(message.chat.id, user)
+    _schedule_chat(
+        message.chat.id, minutes * 60, _delay_after_interval_change(user, minutes * 60)
+    )
     bot.reply_to(message, f"✅ تم تغيير وقت الفحص إلى كل {minutes} دقيقة")
 
 
+@bot.message_handler(commands=["digest"])
+def cmd_digest(message):
+    user = _require_user(message)
+    if not user:
+        return
+    parts = message.text.split()
+    if len(parts) < 2:
+        bot.reply_to(
+            message,
+            "⚠️ أرسل مدة الملخص بالدقائق\nمثال: `/digest 30` · `/digest 0` للإيقاف",
+            parse_mode="Markdown",
+        )
+        return
+    try:
+        minutes = int(parts[1])
+    except ValueError:
+        bot.reply_to(message, "⚠️ أرسل رقماً صحيحاً")
+        return
+    if not 0 <= minutes <= MAX_DIGEST_MINUTES:
+        bot.reply_to(message, f"⚠️ المدة بين 0 و {MAX_DIGEST_MINUTES} دقيقة")
+        return
+    log.info("cmd /digest  chat=%s minutes=%s", message.chat.id, minutes)
+    user["digest_window"] = minutes * 60
+    save_user(message.chat.id, user)
+    if minutes:
+        if digest_timer.pending(message.chat.id):
+            digest_timer.schedule(message.chat.id, minutes * 60)
+        bot.reply_to(message, f"✅ ستصلك التنبيهات في ملخص كل {minutes} دقيقة")
+        return
+    bot.reply_to(message, "✅ ستصلك التنبيهات فور حدوثها")
+    digest_timer.cancel(message.chat.id)
+    _flush_digest(message.chat.id)
+
+
 @bot.message_handler(commands=["logout"])
 def cmd_logout(message):
     if delete_user(message.chat.id):
+        check_scheduler.cancel(message.chat.id)
+        digest_timer.cancel(message.chat.id)
+        digests.discard(message.chat.id)
         bot.reply_to(message, "✅ تم إلغاء تسجيلك. أرسل /start للتسجيل مرة أخرى.")
     else:
         bot.reply_to(message, "⚠️ أنت غير مسجل.")
@@ -818,14 +1241,37 @@ def cmd_logout(message):
 def cmd_admin(message):
     if not is_admin(message.chat.id):
         return
-    users = load_users()
+    users = all_users()
     wait = edugate.backoff_remaining()
     backoff = f"⏸ backoff {wait}s" if wait else "جاهز"
+    shared = lookups.stats()
+    cache = catalog_cache.stats()
+    age = catalog_cache.age()
+    sched = check_scheduler.stats()
+    out = outbox.stats()
+    rendered = listings.stats()
+    slow = slow_lane.stats()
     bot.send_message(
         message.chat.id,
         f"🔧 *لوحة المشرف:*\n\n"
         f"👥 المستخدمون: {len(users)}\n"
-        f"🌐 إيدوجيت: {backoff}\n\n"
+        f"🌐 إيدوجيت: {backoff}\n"
+        f"🔁 استعلامات الشعب: {shared['sent']} مرسلة · {shared['saved']} موفّرة\n"
+        f"🗂 الكتالوج: v{catalog.latest()[0]} (تتبع من v{catalog.oldest()}) · "
+        f"عمره {'—' if age is None else f'{age}s'} · "
+        f"hit {cache['hits']} · miss {cache['misses']} · stale {cache['stale_hits']} · "
+        f"shared {cache['shared']}\n"
+        f"⏱ الجدولة: {sched['depth']} في الطابور · تأخر "
+        f"{sched['late_last']:.1f}s آخر · {sched['late_avg']:.1f}s متوسط · "
+        f"{sched['late_max']:.1f}s أقصى\n"
+        f"📤 الإرسال: {out['pending']} في الطابور · {out['sent']} أُرسلت · "
+        f"{out['failed']} فشلت · 429×{out['throttled']} · زمن "
+        f"{out['latency_avg']:.1f}s متوسط · {out['latency_p95']:.1f}s p95\n"
+        f"📄 قوائم /sections: {rendered['listings']} محفوظة · hit {rendered['hits']} · "
+        f"miss {rendered['misses']}\n"
+        f"🐢 أوامر إيدوجيت: {slow['running']} تعمل · {slow['queued']} تنتظر · "
+        f"{slow['rejected']} مرفوضة · انتظار {slow['wait_avg']:.1f}s متوسط · "
+        f"{slow['wait_max']:.1f}s أقصى\n\n"
         f"/users\n/broadcast `[رسالة]`",
         parse_mode="Markdown",
     )
@@ -835,14 +1281,14 @@ def cmd_admin(message):
 def cmd_users(message):
     if not is_admin(message.chat.id):
         return
-    users = load_users()
+    users = all_users()
     if not users:
         bot.reply_to(message, "📭 لا يوجد مستخدمين مسجلين")
         return
     msg = f"👥 *المستخدمين ({len(users)}):*\n\n"
     for uid, data in users.items():
         interval = data.get("check_interval", config.DEFAULT_CHECK_INTERVAL) // 60
-        sections = len(data.get("sections", {}))
+        sections = catalog.count(data.get("catalog_version"))
         watches = len(data.get("watches") or {})
         msg += f"• `{uid}` ({sections} شعبة, {watches} مراقبة, كل {interval}د)\n"
     bot.send_message(message.chat.id, msg, parse_mode="Markdown")
@@ -856,34 +1302,65 @@ def cmd_broadcast(message):
     if not text:
         bot.reply_to(message, "⚠️ أرسل الرسالة بعد الأمر\nمثال: `/broadcast مرحباً!`", parse_mode="Markdown")
         return
-    users = load_users()
-    sent = 0
+    users = all_users()
     for uid in users:
-        try:
-            bot.send_message(int(uid), f"📢 *رسالة من المشرف:*\n\n{text}", parse_mode="Markdown")
-            sent += 1
-        except Exception:
-            pass
-    bot.reply_to(message, f"✅ تم الإرسال إلى {sent}/{len(users)} مستخدم")
+        outbox.enqueue(int(uid), f"📢 *رسالة من المشرف:*\n\n{text}", parse_mode="Markdown")
+    bot.reply_to(message, f"📤 أُضيفت إلى طابور الإرسال لـ {len(users)} مستخدم")
 
 
 if __name__ == "__main__":
-    Path(USERS_FILE).parent.mkdir(parents=True, exist_ok=True)
     Path(config.SESSION_FILE).parent.mkdir(parents=True, exist_ok=True)
-    users = load_users()
-    if users:
-        save_users(users)
+    _upgrade_legacy_users()
+    users = all_users()
     session_ok = Path(config.SESSION_FILE).is_file()
     log.info("starting")
     log.info(
-        "chats=%s  interval=%sm  jitter=±%ss  min=%sm  session_file=%s",
+        "chats=%s  store=%s  interval=%sm  jitter=±%ss  min=%sm  session_file=%s",
         len(users),
+        users_store.name,
         config.DEFAULT_CHECK_INTERVAL // 60,
         config.CHECK_JITTER,
         config.MIN_CHECK_INTERVAL // 60,
         "yes" if session_ok else "no",
     )
-    thread = threading.Thread(target=scheduler, daemon=True)
-    thread.start()
-    log.info("telegram polling  (Ctrl+C to stop)")
-    bot.infinity_polling()
+    for uid, data in users.items():
+        interval = data.get("check_interval", config.DEFAULT_CHECK_INTERVAL)
+        _schedule_chat(uid, interval, FIRST_CHECK_DELAY)
+    log.info(
+        "scheduler  mode=%s chats=%s timers=%s first check in %ss",
+        config.CHECK_MODE,
+        len(users),
+        check_scheduler.depth(),
+        FIRST_CHECK_DELAY,
+    )
+    check_scheduler.start()
+    _resume_digests(users)
+    digest_timer.start()
+    slow_lane.start()
+    outbox.start()
+    if config.TELEGRAM_MODE == "webhook":
+        # Handlers run on the receiver's workers, not on telebot's own thread pool.
+        bot.threaded = False
+        webhook_server = WebhookServer(
+            bot.process_new_updates,
+            config.WEBHOOK_LISTEN,
+            config.WEBHOOK_PORT,
+            config.WEBHOOK_PATH,
+            config.WEBHOOK_SECRET,
+            workers=config.WEBHOOK_WORKERS,
+            backlog=config.WEBHOOK_BACKLOG,
+        )
+        if config.WEBHOOK_URL:
+            bot.set_webhook(
+                url=config.WEBHOOK_URL + config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET,
+                max_connections=config.WEBHOOK_WORKERS,
+            )
+            log.info("telegram webhook  url=%s", config.WEBHOOK_URL + config.WEBHOOK_PATH)
+        else:
+            log.info("telegram webhook  WEBHOOK_URL empty, not registered with Telegram")
+        webhook_server.serve_forever()
+    else:
+        bot.remove_webhook()
+        log.info("telegram polling  (Ctrl+C to stop)")
+        bot.infinity_polling()
@@ -0,0 +1,365 @@
+"""The latest catalog snapshot plus a ring of deltas, keyed by a rising version number."""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from edugate import CourseIndex, section_fingerprint, section_matches_course
+
+log = logging.getLogger("catalog")
+
+# Per-query course deltas kept before the memo is cleared.
+_COURSE_DELTA_LIMIT = 4096
+
+
+def _content_hash(sections):
+    raw = json.dumps(sections, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _diff(before, after):
+    """{"added": {key: sec}, "removed": {key: sec}, "changed": {key: [old, new]}}.
+
+    Sections count as changed when their fingerprints differ.
+    """
+    return {
+        "added": {key: sec for key, sec in after.items() if key not in before},
+        "removed": {key: sec for key, sec in before.items() if key not in after},
+        "changed": {
+            key: [before[key], sec]
+            for key, sec in after.items()
+            if key in before
+            and before[key] is not sec
+            and section_fingerprint(before[key]) != section_fingerprint(sec)
+        },
+    }
+
+
+class CatalogStore:
+    """One full copy of the latest catalog, and the deltas that led to it.
+
+    put() diffs each new catalog against the latest once and keeps that delta
+    (added, removed, changed sections) in a ring of `keep` entries. Chats keep
+    only the version they were last notified about; changes() replays the
+    deltas since that cursor. A cursor older than the ring gets None, and the
+    caller resyncs the chat to the latest version. put() returns the current
+    version unchanged when the content hash matches, so repeated fetches of an
+    unchanged catalog never create new versions.
+    """
+
+    def __init__(self, directory, keep=100):
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._keep = max(1, keep)
+        self._lock = threading.Lock()
+        self._latest = 0
+        self._sections = None
+        self._hash = ""
+        self._deltas = {}
+        self._indexes = {}
+        self._course_deltas = {}
+        self._load()
+
+    def _latest_path(self):
+        return self._dir / "latest.json"
+
+    def _delta_path(self, version):
+        return self._dir / f"d{version}.json"
+
+    def _write(self, path, payload):
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _read(self, path):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            log.warning("catalog skip  file=%s", path.name)
+            return None
+
+    def _load(self):
+        data = self._read(self._latest_path()) if self._latest_path().exists() else None
+        if data:
+            self._latest = int(data.get("version") or 0)
+            self._sections = data.get("sections") or {}
+            self._hash = data.get("hash") or ""
+        for path in self._dir.glob("d*.json"):
+            delta = self._read(path)
+            if delta and "version" in delta:
+                self._deltas[int(delta["version"])] = delta
+        self._import_snapshots()
+        if self._sections is not None:
+            log.info("catalog loaded  latest=%s deltas=%s", self._latest, len(self._deltas))
+
+    def _import_snapshots(self):
+        """Turn full v{N}.json snapshots from older releases into deltas."""
+        old = []
+        for path in self._dir.glob("v*.json"):
+            data = self._read(path)
+            if data and "version" in data:
+                old.append((int(data["version"]), data, path))
+        if not old:
+            return
+        old.sort(key=lambda item: item[0])
+        for (base, before, _), (version, after, _) in zip(old, old[1:]):
+            if version > self._latest:
+                self._store_delta(version, base, before.get("sections") or {}, after.get("sections") or {})
+        version, data, _ = old[-1]
+        if version > self._latest:
+            self._latest = version
+            self._sections = data.get("sections") or {}
+            self._hash = data.get("hash") or _content_hash(self._sections)
+            self._write(
+                self._latest_path(),
+                {"version": self._latest, "hash": self._hash, "sections": self._sections},
+            )
+        for _, _, path in old:
+            path.unlink()
+        log.info("catalog import  snapshots=%s latest=%s", len(old), self._latest)
+
+    def _store_delta(self, version, base, before, after):
+        delta = {"version": version, "base": base, "count": len(after), **_diff(before, after)}
+        self._deltas[version] = delta
+        self._write(self._delta_path(version), delta)
+        for stale in sorted(self._deltas)[: -self._keep]:
+            del self._deltas[stale]
+            try:
+                self._delta_path(stale).unlink()
+            except OSError:
+                pass
+        return delta
+
+    def put(self, sections):
+        """Store sections if they differ from the latest version. Returns its version."""
+        with self._lock:
+            if sections is self._sections:
+                return self._latest
+            content_hash = _content_hash(sections)
+            if self._sections is not None and content_hash == self._hash:
+                self._sections = sections
+                return self._latest
+            base, before = self._latest, self._sections or {}
+            version = base + 1
+            delta = self._store_delta(version, base, before, sections)
+            self._latest = version
+            self._sections = sections
+            self._hash = content_hash
+            self._write(
+                self._latest_path(),
+                {"version": version, "hash": content_hash, "sections": sections},
+            )
+            self._indexes = {}
+        log.info(
+            "catalog version  v=%s sections=%s added=%s removed=%s changed=%s",
+            version,
+            len(sections),
+            len(delta["added"]),
+            len(delta["removed"]),
+            len(delta["changed"]),
+        )
+        return version
+
+    def get(self, version):
+        """Sections of `version` if it is the latest, else None (only deltas are kept)."""
+        with self._lock:
+            return self._sections if version == self._latest else None
+
+    def count(self, version):
+        with self._lock:
+            if version == self._latest:
+                return len(self._sections or {})
+            delta = self._deltas.get(version)
+            return delta["count"] if delta else 0
+
+    def latest(self):
+        with self._lock:
+            return self._latest, self._sections
+
+    def oldest(self):
+        """The oldest cursor changes() can still replay from."""
+        with self._lock:
+            if not self._deltas:
+                return self._latest
+            return self._deltas[min(self._deltas)]["base"]
+
+    def changes(self, old, new):
+        """Net added / removed / changed sections from version old to new, or None
+        when old is outside the ring (resync)."""
+        if old is None or new is None:
+            return None
+        if old == new:
+            return {"added": {}, "removed": {}, "changed": {}}
+        with self._lock:
+            chain = []
+            version = new
+            while version != old:
+                delta = self._deltas.get(version)
+                if delta is None or version < old:
+                    return None
+                chain.append(delta)
+                version = delta["base"]
+        net = {}
+        for delta in reversed(chain):
+            for key, sec in delta["added"].items():
+                net.setdefault(key, [None, None])[1] = sec
+            for key, sec in delta["removed"].items():
+                net.setdefault(key, [sec, None])[1] = None
+            for key, (before, after) in delta["changed"].items():
+                net.setdefault(key, [before, None])[1] = after
+        result = {"added": {}, "removed": {}, "changed": {}}
+        for key, (before, after) in net.items():
+            if before is None and after is not None:
+                result["added"][key] = after
+            elif before is not None and after is None:
+                result["removed"][key] = before
+            elif before is not None and section_fingerprint(before) != section_fingerprint(after):
+                result["changed"][key] = [before, after]
+        return result
+
+    def index(self, version):
+        """CourseIndex of the latest version, or None for any other."""
+        with self._lock:
+            if version != self._latest or self._sections is None:
+                return None
+            index = self._indexes.get(version)
+            sections = self._sections
+        if index is None:
+            index = CourseIndex(sections)
+            with self._lock:
+                if version == self._latest:
+                    self._indexes = {version: index}
+        return index
+
+    def course_delta(self, old, new, query):
+        """(added keys, {removed key: sec}, {changed key: [old, new]}) of one course
+        between two versions, or None."""
+        memo_key = (old, new, query)
+        with self._lock:
+            cached = self._course_deltas.get(memo_key)
+        if cached is not None:
+            return cached
+        index = self.index(new)
+        changes = self.changes(old, new) if index is not None else None
+        if changes is None:
+            return None
+        matched = index.lookup(query)
+        added = matched & changes["added"].keys()
+        removed = {
+            key: sec
+            for key, sec in changes["removed"].items()
+            if section_matches_course(sec, query)
+        }
+        changed = {key: pair for key, pair in changes["changed"].items() if key in matched}
+        result = (added, removed, changed)
+        with self._lock:
+            if len(self._course_deltas) >= _COURSE_DELTA_LIMIT:
+                self._course_deltas.clear()
+            self._course_deltas[memo_key] = result
+        return result
+
+
+class _Flight:
+    def __init__(self, force=False):
+        self.force = force
+        self.done = threading.Event()
+        self.result = (None, None, "no_result")
+
+
+class CatalogCache:
+    """fetch_catalog behind a TTL, with one in-flight fetch shared by every caller.
+
+    get() returns (version, sections, error); fresh sections are stored in
+    `store` first, so the version is always the store's. With stale=True a
+    caller that allows it gets the last snapshot at once while a background
+    thread refreshes it. Errors are never cached. A forced get() only shares
+    a forced fetch; if a plain one is running it waits for it, then forces
+    its own.
+    """
+
+    def __init__(self, fetch, store, ttl, stale=False):
+        self._fetch = fetch
+        self._store = store
+        self._ttl = ttl
+        self._stale = stale
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._fetched_at = 0.0
+        self._flight = None
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.shared = 0
+
+    def age(self):
+        """Seconds since the last successful fetch, or None before the first one."""
+        with self._lock:
+            if self._snapshot is None:
+                return None
+            return int(time.time() - self._fetched_at)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "shared": self.shared,
+            }
+
+    def get(self, force=False, stale_ok=False):
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and not force:
+                if time.time() - self._fetched_at < self._ttl:
+                    self.hits += 1
+                    return snapshot[0], snapshot[1], None
+                if stale_ok and self._stale:
+                    self.stale_hits += 1
+                    if self._flight is None:
+                        self._flight = _Flight()
+                        threading.Thread(
+                            target=self._run,
+                            args=(self._flight, False),
+                            name="catalog-refresh",
+                            daemon=True,
+                        ).start()
+                    return snapshot[0], snapshot[1], None
+        while True:
+            with self._lock:
+                flight = self._flight
+                owner = flight is None
+                if owner:
+                    flight = self._flight = _Flight(force)
+                    self.misses += 1
+                elif not force or flight.force:
+                    self.shared += 1
+            if owner:
+                self._run(flight, force)
+                return flight.result
+            flight.done.wait()
+            if not force or flight.force:
+                return flight.result
+
+    def _run(self, flight, force):
+        try:
+            sections, error = self._fetch(force)
+            if error:
+                flight.result = (None, sections, error)
+            else:
+                version = self._store.put(sections)
+                flight.result = (version, sections, None)
+                with self._lock:
+                    self._snapshot = (version, sections)
+                    self._fetched_at = time.time()
+        except Exception:
+            log.exception("catalog fetch crashed")
+            flight.result = (None, None, "internal_error")
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.done.set()
@@ -1,4 +1,5 @@
 import os
+import re
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -20,18 +21,89 @@ ADMIN_ID = int(_require("ADMIN_ID"))
 EDUGATE_USERNAME = _require("EDUGATE_USERNAME")
 EDUGATE_PASSWORD = _require("EDUGATE_PASSWORD")
 EDUGATE_PROXY = os.getenv("EDUGATE_PROXY", "").strip()
+# fast = regex scanner (falls back to a tree on a failed sanity check); tree = BeautifulSoup.
+EDUGATE_PARSER = os.getenv("EDUGATE_PARSER", "fast").strip().lower() or "fast"
+# auto = lxml when installed, else the stdlib html.parser.
+EDUGATE_HTML_PARSER = os.getenv("EDUGATE_HTML_PARSER", "auto").strip().lower() or "auto"
+# sync = one request at a time; async = curl_cffi AsyncSession, lookups overlap.
+EDUGATE_CLIENT = os.getenv("EDUGATE_CLIENT", "sync").strip().lower() or "sync"
+EDUGATE_CONCURRENCY = max(1, int(os.getenv("EDUGATE_CONCURRENCY", "4")))
+# Seconds a fetched catalog is reused; CATALOG_SWR=1 lets /sections answer from an
+# older one while a background refresh runs.
+CATALOG_TTL = max(0, int(os.getenv("CATALOG_TTL", "20")))
+CATALOG_SWR = os.getenv("CATALOG_SWR", "0").strip().lower() in {"1", "true", "yes", "on"}
+# Seconds a section lookup answer is shared with other chats watching the same id.
+LOOKUP_TTL = max(0, int(os.getenv("LOOKUP_TTL", "60")))
 USERS_FILE = os.getenv(
     "USERS_FILE", str(Path(__file__).resolve().parent / "users.json")
 )
+USER_STORE = os.getenv("USER_STORE", "sqlite").strip().lower() or "sqlite"
+USERS_DB = os.getenv(
+    "USERS_DB", str(Path(USERS_FILE).resolve().parent / "users.db")
+)
+USERS_FLUSH_INTERVAL = max(0.5, float(os.getenv("USERS_FLUSH_INTERVAL", "2")))
 SESSION_FILE = os.getenv(
     "SESSION_FILE", str(Path(USERS_FILE).resolve().parent / "session.json")
 )
+CATALOG_DIR = os.getenv(
+    "CATALOG_DIR", str(Path(USERS_FILE).resolve().parent / "catalog")
+)
+DIGEST_FILE = os.getenv(
+    "DIGEST_FILE", str(Path(USERS_FILE).resolve().parent / "digests.json")
+)
+# Catalog deltas kept for catch-up; chats further behind are resynced.
+CATALOG_DELTAS = max(1, int(os.getenv("CATALOG_DELTAS", "100")))
+# Outgoing messages: overall messages per second, seconds between messages to one
+# chat, and sender threads.
+DELIVERY_RATE = max(1.0, float(os.getenv("DELIVERY_RATE", "25")))
+DELIVERY_CHAT_INTERVAL = max(0.0, float(os.getenv("DELIVERY_CHAT_INTERVAL", "1")))
+DELIVERY_WORKERS = max(1, int(os.getenv("DELIVERY_WORKERS", "4")))
+# Commands that call Edugate (/start, /check, /sections, /watch, /course) run on
+# their own threads with a bounded queue; the rest answer at once.
+SLOW_WORKERS = max(1, int(os.getenv("SLOW_WORKERS", "4")))
+SLOW_QUEUE = max(1, int(os.getenv("SLOW_QUEUE", "50")))
+# polling = long-poll getUpdates; webhook = Telegram POSTs updates to WEBHOOK_URL.
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").strip().lower() or "polling"
+# Public base URL Telegram posts to; empty = run the receiver without registering it.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0").strip() or "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = "/" + (os.getenv("WEBHOOK_PATH", "telegram").strip().strip("/") or "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+WEBHOOK_WORKERS = max(1, int(os.getenv("WEBHOOK_WORKERS", "8")))
+WEBHOOK_BACKLOG = max(1, int(os.getenv("WEBHOOK_BACKLOG", "256")))
 MAX_WATCHES = max(1, int(os.getenv("MAX_WATCHES", "15")))
 
 # Intervals in .env are minutes; jitter is seconds. bot.py stores seconds.
 DEFAULT_CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "60")) * 60
 MIN_CHECK_INTERVAL = int(os.getenv("MIN_CHECK_INTERVAL", "15")) * 60
 CHECK_JITTER = max(0, int(os.getenv("CHECK_JITTER", "5")))
+# Minutes of notifications merged into one digest for new chats; 0 sends each at once.
+DIGEST_WINDOW = max(0, int(os.getenv("DIGEST_WINDOW", "0"))) * 60
+# chat = each chat on its own timer; cycle = chats with the same interval share one
+# tick and one catalog fetch.
+CHECK_MODE = os.getenv("CHECK_MODE", "chat").strip().lower() or "chat"
+
+if EDUGATE_CLIENT not in {"sync", "async"}:
+    raise RuntimeError("EDUGATE_CLIENT must be sync or async.")
+
+if EDUGATE_PARSER not in {"fast", "tree"}:
+    raise RuntimeError("EDUGATE_PARSER must be fast or tree.")
+
+if EDUGATE_HTML_PARSER not in {"auto", "lxml", "html.parser"}:
+    raise RuntimeError("EDUGATE_HTML_PARSER must be auto, lxml or html.parser.")
+
+if TELEGRAM_MODE not in {"polling", "webhook"}:
+    raise RuntimeError("TELEGRAM_MODE must be polling or webhook.")
+
+if TELEGRAM_MODE == "webhook" and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+    raise RuntimeError("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ and -.")
+
+if CHECK_MODE not in {"chat", "cycle"}:
+    raise RuntimeError("CHECK_MODE must be chat or cycle.")
+
+if USER_STORE not in {"json", "sqlite"}:
+    raise RuntimeError("USER_STORE must be json or sqlite.")
 
 if DEFAULT_CHECK_INTERVAL < MIN_CHECK_INTERVAL:
     raise RuntimeError(
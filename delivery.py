@@ -0,0 +1,201 @@
+"""Outgoing Telegram messages: a queue drained by worker threads under rate limits."""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from telebot.apihelper import ApiTelegramException
+
+log = logging.getLogger("outbox")
+
+# Attempts for network errors; Telegram API errors other than 429 are not retried.
+_MAX_ATTEMPTS = 3
+
+
+class _Message:
+    __slots__ = ("chat_id", "text", "kwargs", "queued_at", "attempts")
+
+    def __init__(self, chat_id, text, kwargs):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.queued_at = time.time()
+        self.attempts = 0
+
+
+class DeliveryQueue:
+    """send(chat_id, text, **kwargs) runs on `workers` threads, never faster than
+    `rate` messages per second overall or one per `chat_interval` seconds per chat.
+
+    Messages to one chat go out in the order they were queued: a chat is handed
+    to one worker at a time and sits in a heap keyed on when it may send next.
+    A 429 puts the message back at the front of its chat and holds that chat for
+    the `retry_after` Telegram asked for; the token bucket pauses for the same
+    time, since a flood limit on one chat usually means the bot as a whole is
+    sending too fast.
+    """
+
+    def __init__(self, send, rate=30, chat_interval=1.0, workers=4, history=500):
+        self._send = send
+        self._rate = max(1.0, float(rate))
+        self._chat_interval = max(0.0, float(chat_interval))
+        self._workers = max(1, int(workers))
+        self._cond = threading.Condition()
+        self._chats = {}
+        self._ready = []
+        self._scheduled = set()
+        self._busy = set()
+        self._next_send = {}
+        self._seq = itertools.count()
+        self._tokens = 1.0
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._latency = deque(maxlen=history)
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+
+    def enqueue(self, chat_id, text, **kwargs):
+        """Queue one message and return at once."""
+        with self._cond:
+            self._chats.setdefault(chat_id, deque()).append(_Message(chat_id, text, kwargs))
+            self.queued += 1
+            self._wake(chat_id)
+
+    def pending(self):
+        with self._cond:
+            return sum(len(messages) for messages in self._chats.values())
+
+    def stats(self):
+        """Counters plus enqueue-to-delivery latency of recent messages."""
+        with self._cond:
+            latency = sorted(self._latency)
+            return {
+                "pending": sum(len(messages) for messages in self._chats.values()),
+                "chats": len(self._chats),
+                "sent": self.sent,
+                "failed": self.failed,
+                "throttled": self.throttled,
+                "latency_avg": sum(latency) / len(latency) if latency else 0.0,
+                "latency_p95": latency[int(len(latency) * 0.95)] if latency else 0.0,
+                "latency_max": latency[-1] if latency else 0.0,
+            }
+
+    def _wake(self, chat_id):
+        """Put chat_id in the ready heap unless it is there or being sent. Hold _cond."""
+        if chat_id in self._scheduled or chat_id in self._busy or not self._chats.get(chat_id):
+            return
+        due = max(time.time(), self._next_send.get(chat_id, 0.0))
+        heapq.heappush(self._ready, (due, next(self._seq), chat_id))
+        self._scheduled.add(chat_id)
+        self._cond.notify()
+
+    def _take(self):
+        """Block until a chat may send; return its next message. Call with _cond held."""
+        while True:
+            if not self._ready:
+                self._cond.wait()
+                continue
+            wait = self._ready[0][0] - time.time()
+            if wait > 0:
+                self._cond.wait(wait)
+                continue
+            _due, _seq, chat_id = heapq.heappop(self._ready)
+            self._scheduled.discard(chat_id)
+            self._busy.add(chat_id)
+            return self._chats[chat_id].popleft()
+
+    def _token(self):
+        """Wait for the global rate limit to allow one more send. The bucket holds a
+        single token, so sends are spaced evenly rather than bursting `rate` at once.
+        While a 429 pause runs the bucket stays empty and refills from its end."""
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(1.0, self._tokens + (now - self._refilled) * self._rate)
+                    self._refilled = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def _deliver(self, message):
+        """Send once; return seconds to hold the chat before a retry, or None when done."""
+        message.attempts += 1
+        try:
+            self._send(message.chat_id, message.text, **message.kwargs)
+        except ApiTelegramException as exc:
+            if exc.error_code == 429:
+                retry_after = (exc.result_json or {}).get("parameters", {}).get("retry_after", 5)
+                log.warning("send throttled  chat=%s retry_after=%ss", message.chat_id, retry_after)
+                with self._cond:
+                    self.throttled += 1
+                    resume = time.monotonic() + float(retry_after)
+                    if resume > self._paused_until:
+                        self._paused_until = resume
+                        self._tokens = 0.0
+                        self._refilled = resume
+                return float(retry_after)
+            log.error(
+                "send fail  chat=%s code=%s error=%s",
+                message.chat_id,
+                exc.error_code,
+                exc.description,
+            )
+        except Exception as exc:
+            if message.attempts < _MAX_ATTEMPTS:
+                log.warning(
+                    "send retry  chat=%s attempt=%s error=%s",
+                    message.chat_id,
+                    message.attempts,
+                    type(exc).__name__,
+                )
+                return 2.0 * message.attempts
+            log.error("send fail  chat=%s error=%s", message.chat_id, type(exc).__name__)
+        else:
+            with self._cond:
+                self.sent += 1
+                self._latency.append(time.time() - message.queued_at)
+            return None
+        with self._cond:
+            self.failed += 1
+        return None
+
+    def _forget_idle_chats(self):
+        """Drop per-chat send times that have passed. Call with _cond held."""
+        now = time.time()
+        self._next_send = {chat: due for chat, due in self._next_send.items() if due > now}
+
+    def run(self):
+        while True:
+            with self._cond:
+                message = self._take()
+            self._token()
+            hold = self._deliver(message)
+            with self._cond:
+                chat_id = message.chat_id
+                if hold is not None:
+                    self._chats[chat_id].appendleft(message)
+                self._next_send[chat_id] = time.time() + max(self._chat_interval, hold or 0.0)
+                self._busy.discard(chat_id)
+                if self._chats[chat_id]:
+                    self._wake(chat_id)
+                else:
+                    del self._chats[chat_id]
+                    if len(self._next_send) > 1000:
+                        self._forget_idle_chats()
+
+    def start(self):
+        threads = []
+        for number in range(self._workers):
+            thread = threading.Thread(target=self.run, name=f"outbox-{number}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
@@ -0,0 +1,124 @@
+"""Section events held per chat and merged to their net effect before sending."""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from edugate import section_fingerprint
+
+log = logging.getLogger("digest")
+
+
+class DigestBuffer:
+    """Collects (before, after) section states per chat; before/after is None when
+    the section was absent (not in the catalog, or a watch that was closed).
+
+    Only the first `before` and the last `after` of a key are kept, so a section
+    that opens, closes and opens again inside one window comes out as whatever
+    changed overall, often nothing.
+
+    With a path, held events are written there (temp + rename) by save() and
+    discard() and read back on start, so a restart inside the window does not
+    lose alerts whose catalog cursor has already moved on.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._events = {}
+        self._since = {}
+        self._path = Path(path) if path else None
+        self._dirty = False
+        if self._path:
+            self._load()
+
+    def add(self, chat_id, key, before, after):
+        """Record one event; True when it is the chat's first since the last take().
+        Call save() once a batch of events is in."""
+        with self._lock:
+            events = self._events.get(chat_id)
+            first = events is None
+            if first:
+                events = self._events[chat_id] = {}
+                self._since[chat_id] = time.time()
+            if key in events:
+                events[key][1] = after
+            else:
+                events[key] = [before, after]
+            self._dirty = True
+            return first
+
+    def held(self):
+        """{chat_id: time of its first held event} for every chat with events."""
+        with self._lock:
+            return dict(self._since)
+
+    def save(self):
+        with self._lock:
+            if not self._path or not self._dirty:
+                return
+            state = {
+                str(chat_id): {
+                    "since": self._since.get(chat_id, 0),
+                    "events": [[list(key), before, after] for key, (before, after) in events.items()],
+                }
+                for chat_id, events in self._events.items()
+            }
+            tmp = self._path.with_name(f".{self._path.name}.tmp")
+            try:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(state, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self._path)
+            except OSError as e:
+                log.error("digest save fail  path=%s error=%s", self._path, e)
+                return
+            self._dirty = False
+
+    def _load(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.error("digest load fail  path=%s error=%s", self._path, e)
+            return
+        for chat_id, held in state.items():
+            events = {tuple(key): [before, after] for key, before, after in held.get("events") or ()}
+            if events:
+                self._events[int(chat_id)] = events
+                self._since[int(chat_id)] = held.get("since") or time.time()
+        log.info("digest load  chats=%s", len(self._events))
+
+    def pending(self, chat_id):
+        with self._lock:
+            return len(self._events.get(chat_id) or {})
+
+    def discard(self, chat_id):
+        with self._lock:
+            self._since.pop(chat_id, None)
+            self._dirty |= self._events.pop(chat_id, None) is not None
+        self.save()
+
+    def take(self, chat_id):
+        """(added, removed, [old, new] pairs) for the chat, netted; clears its events.
+        The file is not rewritten here; call save() once the digest has been sent."""
+        with self._lock:
+            self._since.pop(chat_id, None)
+            events = self._events.pop(chat_id, None) or {}
+            self._dirty |= bool(events)
+        added = []
+        removed = []
+        changed = []
+        for before, after in events.values():
+            if before is None and after is not None:
+                added.append(after)
+            elif before is not None and after is None:
+                removed.append(before)
+            elif before is not None and section_fingerprint(before) != section_fingerprint(after):
+                changed.append([before, after])
+        return added, removed, changed
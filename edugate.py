@@ -1,4 +1,7 @@
 """Edugate client: cookie session, catalog parse, official section lookup."""
+import functools
+import hashlib
+import html as html_lib
 import json
 import logging
 import os
@@ -7,6 +10,7 @@ import re
 import socket
 import threading
 import time
+from collections import deque
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -162,19 +166,144 @@ _HIDDEN_PREFIXES = (
 )
 
 
-class EdugateClient:
+# fetch_catalog errors that mean "network trouble", not "bad page or login".
+_CATALOG_BACKOFF_ERRORS = {
+    "ConnectionError",
+    "Connection timeout",
+    "Timeout",
+    "ChunkedEncodingError",
+}
+_LOOKUP_BACKOFF_ERRORS = {"ConnectionError", "timeout", "ChunkedEncodingError"}
+
+
+class _EdugateState:
+    """Backoff, saved cookies and catalog parse state shared by both clients."""
+
     def __init__(self):
-        self._lock = threading.Lock()
-        self._session_factory = lambda cookies: _make_curl_session(
-            http1=True, ipv4=True, cookies=cookies
-        )
-        self._session = self._session_factory({})
+        self._session = None
         self._courses_url = None
         self._backoff_until = 0.0
         self._backoff_seconds = BUSY_BACKOFF_START
         self._busy_alerted = False
-        self._catalog_cache = (0.0, None)
+        self._alert_lock = threading.Lock()
+        self._parser = IncrementalCatalogParser()
         self._reachable = False
+
+    def backoff_remaining(self):
+        return max(0, int(self._backoff_until - time.time()))
+
+    def consume_busy_alert(self):
+        """True once per busy episode so chats are not spammed."""
+        with self._alert_lock:
+            if self._busy_alerted or self.backoff_remaining() <= 0:
+                return False
+            self._busy_alerted = True
+            return True
+
+    def _trip_backoff(self):
+        self._backoff_until = time.time() + self._backoff_seconds
+        self._backoff_seconds = min(self._backoff_seconds * 2, BUSY_BACKOFF_CAP)
+        self._busy_alerted = False
+
+    def _clear_backoff(self):
+        self._backoff_until = 0.0
+        self._backoff_seconds = BUSY_BACKOFF_START
+        self._busy_alerted = False
+
+    def _catalog_backoff(self):
+        """(None, error) while backing off, else None. Caching is catalog.CatalogCache's job."""
+        wait = self.backoff_remaining()
+        if wait:
+            log.info("catalog skip  reason=backoff wait=%ss", wait)
+            return None, f"busy_backoff:{wait}"
+        return None
+
+    def _catalog_parsed(self, html, source, started):
+        """Parse a fetched page; returns (sections, error) like fetch_catalog."""
+        sections, changed = self._parser.parse(html)
+        return self._catalog_accepted(sections, changed, source, started)
+
+    def _catalog_accepted(self, sections, changed, source, started):
+        """Session and backoff bookkeeping for a parse result; (sections, error)."""
+        if not sections:
+            log.error("catalog fail  error=empty_parse source=%s", source)
+            return None, "Could not parse any sections"
+        self._clear_backoff()
+        self._save_session()
+        log.info(
+            "catalog ok  source=%s sections=%s changed=%s ms=%s",
+            source,
+            len(sections),
+            "yes" if changed else "no",
+            int((time.time() - started) * 1000),
+        )
+        return sections, None
+
+    def _catalog_failed(self, error):
+        if error in _CATALOG_BACKOFF_ERRORS:
+            self._trip_backoff()
+            log.warning("catalog fail  error=%s backoff=%ss", error, self.backoff_remaining())
+        else:
+            log.error("catalog fail  error=%s", error)
+        return None, error
+
+    def _lookup_logged(self, section_id, result):
+        """Apply backoff rules to a finished lookup and log it."""
+        if result.get("status") == "busy":
+            self._trip_backoff()
+            log.warning("lookup %s  busy backoff=%ss", section_id, self.backoff_remaining())
+        elif result.get("status") == "error" and result.get("error") in _LOOKUP_BACKOFF_ERRORS:
+            self._trip_backoff()
+            log.warning(
+                "lookup %s  error=%s backoff=%ss",
+                section_id,
+                result.get("error"),
+                self.backoff_remaining(),
+            )
+        elif result.get("status") == "open":
+            self._clear_backoff()
+            log.info("lookup %s  status=open", section_id)
+        else:
+            log.info("lookup %s  status=%s", section_id, result.get("status"))
+        return result
+
+    def _session_path(self):
+        return Path(config.SESSION_FILE)
+
+    def _load_session(self):
+        path = self._session_path()
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return
+        cookies = data.get("cookies") or {}
+        if isinstance(cookies, dict):
+            self._session.cookies.update(cookies)
+        self._courses_url = _stable_courses_url(data.get("courses_url"))
+        log.info(
+            "session loaded  cookies=%s  saved_url=%s",
+            len(cookies) if isinstance(cookies, dict) else 0,
+            "yes" if self._courses_url else "no",
+        )
+
+    def _save_session(self):
+        path = self._session_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "cookies": _cookie_dict(self._session),
+            "courses_url": _stable_courses_url(self._courses_url),
+        }
+        path.write_text(json.dumps(payload), encoding="utf-8")
+
+
+class EdugateClient(_EdugateState):
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._session_factory = lambda cookies: _make_curl_session(
+            http1=True, ipv4=True, cookies=cookies
+        )
+        self._session = self._session_factory({})
         log.info(
             "http  docker=%s  proxy=%s",
             "yes" if _in_docker() else "no",
@@ -310,22 +439,14 @@ class EdugateClient:
             self._rebuild_session(keep_cookies=True)
             return self._session.post(url, headers=headers, **kwargs)
 
-    def backoff_remaining(self):
-        return max(0, int(self._backoff_until - time.time()))
-
     def fetch_catalog(self, force=False):
         """Return (sections_dict, error_or_none). Reuses cookies when possible."""
         with self._lock:
             started = time.time()
             if not force:
-                wait = self.backoff_remaining()
-                if wait:
-                    log.info("catalog skip  reason=backoff wait=%ss", wait)
-                    return None, f"busy_backoff:{wait}"
-                cached_at, cached = self._catalog_cache
-                if cached is not None and time.time() - cached_at < 20:
-                    log.info("catalog ok  source=cache sections=%s", len(cached))
-                    return cached, None
+                skipped = self._catalog_backoff()
+                if skipped is not None:
+                    return skipped
 
             if not self._reachable:
                 self._pick_transport()
@@ -345,36 +466,8 @@ class EdugateClient:
                     time.sleep(RETRY_PAUSE)
                 html, error = self._login_and_open_catalog()
                 if error:
-                    if error in {
-                        "ConnectionError",
-                        "Connection timeout",
-                        "Timeout",
-                        "ChunkedEncodingError",
-                    }:
-                        self._trip_backoff()
-                        log.warning(
-                            "catalog fail  error=%s backoff=%ss",
-                            error,
-                            self.backoff_remaining(),
-                        )
-                    else:
-                        log.error("catalog fail  error=%s", error)
-                    return None, error
-
-            sections = parse_sections(html)
-            if not sections:
-                log.error("catalog fail  error=empty_parse source=%s", source)
-                return None, "Could not parse any sections"
-            self._catalog_cache = (time.time(), sections)
-            self._clear_backoff()
-            self._save_session()
-            log.info(
-                "catalog ok  source=%s sections=%s ms=%s",
-                source,
-                len(sections),
-                int((time.time() - started) * 1000),
-            )
-            return sections, None
+                    return self._catalog_failed(error)
+            return self._catalog_parsed(html, source, started)
 
     def lookup_section(self, section_id):
         """Official add-box lookup. Returns a status dict. Never submits add."""
@@ -396,27 +489,17 @@ class EdugateClient:
                     log.error("lookup %s  re-login fail error=%s", section_id, error)
                     return {"section_id": section_id, "status": "error", "error": error}
                 result = self._lookup_unlocked(section_id)
+            return self._lookup_logged(section_id, result)
+
+    def lookup_many(self, section_ids):
+        """{section_id: result}, one after another; stops after a busy answer."""
+        results = {}
+        for section_id in section_ids:
+            result = self.lookup_section(section_id)
+            results[str(section_id).strip()] = result
             if result.get("status") == "busy":
-                self._trip_backoff()
-                log.warning("lookup %s  busy backoff=%ss", section_id, self.backoff_remaining())
-            elif result.get("status") == "error" and result.get("error") in {
-                "ConnectionError",
-                "timeout",
-                "ChunkedEncodingError",
-            }:
-                self._trip_backoff()
-                log.warning(
-                    "lookup %s  error=%s backoff=%ss",
-                    section_id,
-                    result.get("error"),
-                    self.backoff_remaining(),
-                )
-            elif result.get("status") == "open":
-                self._clear_backoff()
-                log.info("lookup %s  status=open", section_id)
-            else:
-                log.info("lookup %s  status=%s", section_id, result.get("status"))
-            return result
+                break
+        return results
 
     def _lookup_unlocked(self, section_id):
         if not self._session.cookies:
@@ -434,45 +517,7 @@ class EdugateClient:
             return {"section_id": section_id, "status": "error", "error": "timeout"}
         except _NETWORK_ERRORS as exc:
             return {"section_id": section_id, "status": "error", "error": type(exc).__name__}
-
-        body = (resp.text or "").strip()
-        path = urlparse(resp.url).path
-        if path.endswith("home.faces") or 'name="username"' in body:
-            return {"section_id": section_id, "status": "session_expired"}
-        if body == "busy":
-            return {"section_id": section_id, "status": "busy"}
-        if body == "":
-            return {"section_id": section_id, "status": "error", "error": "empty"}
-        if body == "-1":
-            return {"section_id": section_id, "status": "not_found"}
-        if body in {"-2", "-3"}:
-            return {"section_id": section_id, "status": "unavailable"}
-        if body == "-4":
-            return {"section_id": section_id, "status": "unavailable"}
-
-        parts = body.split("-@F1@-")
-        if len(parts) < 8:
-            return {"section_id": section_id, "status": "unavailable"}
-
-        return {
-            "section_id": section_id,
-            "status": "open",
-            "course_code": _clean(parts[2] if len(parts) > 2 else ""),
-            "course_name": _clean(parts[4] if len(parts) > 4 else ""),
-            "activity": _clean(parts[5] if len(parts) > 5 else ""),
-            "time": _plain_time(parts[6] if len(parts) > 6 else ""),
-            "doctor": _clean(parts[7] if len(parts) > 7 else ""),
-            "group": _clean(parts[10] if len(parts) > 10 else ""),
-            "section_num": _clean(parts[3] if len(parts) > 3 else ""),
-        }
-
-    def consume_busy_alert(self):
-        """True once per busy episode so chats are not spammed."""
-        with self._lock:
-            if self._busy_alerted or self.backoff_remaining() <= 0:
-                return False
-            self._busy_alerted = True
-            return True
+        return _lookup_result(section_id, resp)
 
     def _catalog_html_reused(self):
         if not self._session.cookies:
@@ -503,42 +548,19 @@ class EdugateClient:
         self._rebuild_session(keep_cookies=False)
         self._courses_url = None
         try:
-            login_page = self._get(LOGIN_URL)
-            soup = BeautifulSoup(login_page.text, "html.parser")
-            viewstate = soup.find("input", {"name": "javax.faces.ViewState"})
+            viewstate = _viewstate(self._get(LOGIN_URL).text)
             if not viewstate:
                 return None, "Could not find ViewState on login page"
 
-            login_response = self._post(
-                LOGIN_URL,
-                data={
-                    "loginForm": "loginForm",
-                    "biConnectionConfig": "true",
-                    "token": "",
-                    "username": config.EDUGATE_USERNAME,
-                    "password": config.EDUGATE_PASSWORD,
-                    "newsCode": "",
-                    "javax.faces.ViewState": viewstate["value"],
-                    "loginUsersLink": "loginUsersLink",
-                },
-            )
+            login_response = self._post(LOGIN_URL, data=_login_form(viewstate))
             if not _login_succeeded(login_response):
                 return None, "Login failed — check EDUGATE credentials"
 
-            reg_page = self._get(REGISTRATION_URL)
-            soup = BeautifulSoup(reg_page.text, "html.parser")
-            viewstate = soup.find("input", {"name": "javax.faces.ViewState"})
+            viewstate = _viewstate(self._get(REGISTRATION_URL).text)
             if not viewstate:
                 return None, "Could not access registration page"
 
-            self._post(
-                REGISTRATION_URL,
-                data={
-                    "myForm": "myForm",
-                    "javax.faces.ViewState": viewstate["value"],
-                    "myForm:serLinkDropAdd2": "myForm:serLinkDropAdd2",
-                },
-            )
+            self._post(REGISTRATION_URL, data=_registration_form(viewstate))
 
             html, url = self._follow_add_courses()
             if not html:
@@ -552,51 +574,81 @@ class EdugateClient:
             return None, type(exc).__name__
 
     def _follow_add_courses(self):
-        add_response = self._get(f"{ADD_COURSES_URL}?reg={random.random()}")
-        match = re.search(r'window\.location\.replace\("([^"]+)"\)', add_response.text)
-        if not match:
+        url = _add_courses_target(self._get(_add_courses_url()).text)
+        if not url:
             return None, None
-        url = BASE_URL + match.group(1)
         courses = self._get(url)
         return courses.text, url
 
-    def _trip_backoff(self):
-        self._backoff_until = time.time() + self._backoff_seconds
-        self._backoff_seconds = min(self._backoff_seconds * 2, BUSY_BACKOFF_CAP)
-        self._busy_alerted = False
-
-    def _clear_backoff(self):
-        self._backoff_until = 0.0
-        self._backoff_seconds = BUSY_BACKOFF_START
-        self._busy_alerted = False
-
-    def _session_path(self):
-        return Path(config.SESSION_FILE)
 
-    def _load_session(self):
-        path = self._session_path()
-        try:
-            data = json.loads(path.read_text(encoding="utf-8"))
-        except (FileNotFoundError, json.JSONDecodeError, OSError):
-            return
-        cookies = data.get("cookies") or {}
-        if isinstance(cookies, dict):
-            self._session.cookies.update(cookies)
-        self._courses_url = _stable_courses_url(data.get("courses_url"))
-        log.info(
-            "session loaded  cookies=%s  saved_url=%s",
-            len(cookies) if isinstance(cookies, dict) else 0,
-            "yes" if self._courses_url else "no",
-        )
-
-    def _save_session(self):
-        path = self._session_path()
-        path.parent.mkdir(parents=True, exist_ok=True)
-        payload = {
-            "cookies": _cookie_dict(self._session),
-            "courses_url": _stable_courses_url(self._courses_url),
-        }
-        path.write_text(json.dumps(payload), encoding="utf-8")
+def _viewstate(html):
+    soup = BeautifulSoup(html, "html.parser")
+    field = soup.find("input", {"name": "javax.faces.ViewState"})
+    return field["value"] if field else None
+
+
+def _login_form(viewstate):
+    return {
+        "loginForm": "loginForm",
+        "biConnectionConfig": "true",
+        "token": "",
+        "username": config.EDUGATE_USERNAME,
+        "password": config.EDUGATE_PASSWORD,
+        "newsCode": "",
+        "javax.faces.ViewState": viewstate,
+        "loginUsersLink": "loginUsersLink",
+    }
+
+
+def _registration_form(viewstate):
+    return {
+        "myForm": "myForm",
+        "javax.faces.ViewState": viewstate,
+        "myForm:serLinkDropAdd2": "myForm:serLinkDropAdd2",
+    }
+
+
+def _add_courses_url():
+    return f"{ADD_COURSES_URL}?reg={random.random()}"
+
+
+def _add_courses_target(html):
+    match = re.search(r'window\.location\.replace\("([^"]+)"\)', html)
+    return BASE_URL + match.group(1) if match else None
+
+
+def _lookup_result(section_id, resp):
+    """Classify a section servlet response into the result dict lookup_section returns."""
+    body = (resp.text or "").strip()
+    path = urlparse(resp.url).path
+    if path.endswith("home.faces") or 'name="username"' in body:
+        return {"section_id": section_id, "status": "session_expired"}
+    if body == "busy":
+        return {"section_id": section_id, "status": "busy"}
+    if body == "":
+        return {"section_id": section_id, "status": "error", "error": "empty"}
+    if body == "-1":
+        return {"section_id": section_id, "status": "not_found"}
+    if body in {"-2", "-3"}:
+        return {"section_id": section_id, "status": "unavailable"}
+    if body == "-4":
+        return {"section_id": section_id, "status": "unavailable"}
+
+    parts = body.split("-@F1@-")
+    if len(parts) < 8:
+        return {"section_id": section_id, "status": "unavailable"}
+
+    return {
+        "section_id": section_id,
+        "status": "open",
+        "course_code": _clean(parts[2] if len(parts) > 2 else ""),
+        "course_name": _clean(parts[4] if len(parts) > 4 else ""),
+        "activity": _clean(parts[5] if len(parts) > 5 else ""),
+        "time": _plain_time(parts[6] if len(parts) > 6 else ""),
+        "doctor": _clean(parts[7] if len(parts) > 7 else ""),
+        "group": _clean(parts[10] if len(parts) > 10 else ""),
+        "section_num": _clean(parts[3] if len(parts) > 3 else ""),
+    }
 
 
 def _login_succeeded(response):
@@ -618,9 +670,24 @@ def _looks_like_catalog(html):
 
 
 def _clean(text):
+    """Visible text of an HTML fragment, like get_text(" ", strip=True): tags
+    and comments are dropped, and so is the content of <script> and <style>.
+
+    Character references go through html.unescape, so a malformed one can read
+    differently from html.parser: a bare "&" is kept ("A&B" stays "A&B", where
+    html.parser gives "AB"), and "&copy2" becomes "©2". Edugate's fields only
+    hold well-formed references.
+    """
     if not text:
         return ""
-    return BeautifulSoup(str(text), "html.parser").get_text(" ", strip=True)
+    return _clean_cached(str(text))
+
+
+@functools.lru_cache(maxsize=8192)
+def _clean_cached(text):
+    if "<" not in text and "&" not in text:
+        return text.strip()
+    return " ".join(_segment_strings(text))
 
 
 def _plain_time(raw):
@@ -630,38 +697,115 @@ def _plain_time(raw):
     return _clean(text)
 
 
-def parse_sections(html):
-    """Merge tooltip IDs with allData hidden fields (name, time, activity)."""
-    from_tip = _parse_tooltips(html)
-    from_hidden = _parse_hidden(html)
+def _pick_html_parser():
+    choice = config.EDUGATE_HTML_PARSER
+    if choice in {"auto", "lxml"}:
+        try:
+            import lxml  # noqa: F401
+
+            return "lxml"
+        except ImportError:
+            if choice == "lxml":
+                log.warning("parser  lxml not installed, using html.parser")
+    return "html.parser"
+
+
+_HTML_PARSER = _pick_html_parser()
+
+
+def parse_sections(html, engine=None):
+    """Merge tooltip IDs with allData hidden fields (name, time, activity).
+
+    html is a string or an iterable of text chunks. The fast engine never
+    builds a tree; it falls back to BeautifulSoup when its sanity check fails.
+    """
+    chunks = [html] if isinstance(html, str) else html
+    if (engine or config.EDUGATE_PARSER) == "fast":
+        scanner = _CatalogScanner()
+        seen = []
+        for chunk in chunks:
+            seen.append(chunk)
+            scanner.feed(chunk)
+        result = scanner.close()
+        if result is not None:
+            return _merge_sections(*result)
+        log.warning("parse fast  sanity check failed (%s), using tree", scanner.problem)
+        chunks = seen
+    return _parse_sections_tree("".join(chunks))
+
+
+def _parse_sections_tree(html):
+    links, inputs = _scan_catalog(BeautifulSoup(html, _HTML_PARSER))
+    return _merge_sections(_parse_tooltips(links), _parse_hidden(inputs))
+
+
+def _scan_catalog(soup):
+    """One walk: tooltip anchors, and inputs of the first allData form (None if absent)."""
+    links = []
+    inputs = None
+    form = None
+    for tag in soup.find_all(("a", "form", "input")):
+        if tag.name == "a":
+            onclick = tag.get("onclick")
+            if onclick and "showToolTip(this,event," in onclick:
+                links.append(tag)
+        elif tag.name == "form":
+            if form is None and tag.get("name") == "allData":
+                form = tag
+                inputs = []
+        elif form is not None and any(parent is form for parent in tag.parents):
+            inputs.append(tag)
+    return links, inputs
+
+
+def _merge_sections(from_tip, from_hidden):
+    """Fill tooltip sections from hidden fields in one pass over each side.
+
+    A hidden row is matched by (course_id, section_num) first, then by
+    (section_num, course_name), then by a section_num row whose course name
+    contains the tooltip's or is contained in it, then by section_num alone.
+    Each bucket is a queue; rows already taken are dropped as they reach the
+    front, so the similar-name scan starts at the first row still free.
+    """
     if not from_tip and not from_hidden:
         return {}
     if not from_tip:
-        return from_hidden
-    hidden_by_num = {}
+        return _fingerprinted(from_hidden)
+    by_course = {}
+    by_name = {}
+    by_num = {}
     for sec in from_hidden.values():
-        hidden_by_num.setdefault(str(sec.get("section_num", "")), []).append(sec)
+        num = str(sec.get("section_num", ""))
+        by_course.setdefault((str(sec.get("course_id", "")), num), deque()).append(sec)
+        if sec.get("course_name"):
+            by_name.setdefault((num, sec["course_name"]), deque()).append(sec)
+        by_num.setdefault(num, deque()).append(sec)
 
     used = set()
-    for key, sec in from_tip.items():
-        cands = [
-            h
-            for h in hidden_by_num.get(str(sec.get("section_num", "")), [])
-            if id(h) not in used
-        ]
-        match = None
-        if len(cands) == 1:
-            match = cands[0]
-        elif cands and sec.get("course_name"):
-            for h in cands:
-                if h.get("course_name") and (
-                    h["course_name"] in sec["course_name"]
-                    or sec["course_name"] in h["course_name"]
-                ):
-                    match = h
-                    break
-        if match is None and cands:
-            match = cands[0]
+
+    def take(bucket):
+        while bucket and id(bucket[0]) in used:
+            bucket.popleft()
+        return bucket.popleft() if bucket else None
+
+    def take_similar(bucket, name):
+        while bucket and id(bucket[0]) in used:
+            bucket.popleft()
+        for cand in bucket or ():
+            other = cand.get("course_name")
+            if id(cand) not in used and other and (other in name or name in other):
+                return cand
+        return None
+
+    for sec in from_tip.values():
+        num = str(sec.get("section_num", ""))
+        match = take(by_course.get((str(sec.get("course_id", "")), num)))
+        if match is None and sec.get("course_name"):
+            match = take(by_name.get((num, sec["course_name"])))
+            if match is None:
+                match = take_similar(by_num.get(num), sec["course_name"])
+        if match is None:
+            match = take(by_num.get(num))
         if match:
             used.add(id(match))
             for field in ("course_name", "course_code", "activity", "time", "doctor", "group"):
@@ -673,49 +817,99 @@ def parse_sections(html):
                 sec["doctor"] = match["doctor"]
             if match.get("course_name"):
                 sec["course_name"] = match["course_name"]
-    return from_tip
+    return _fingerprinted(from_tip)
 
 
-def _parse_tooltips(html):
-    soup = BeautifulSoup(html, "html.parser")
+# Fields a user sees for a section; a change in any of them is worth a message.
+FINGERPRINT_FIELDS = (
+    "course_code",
+    "course_name",
+    "section_num",
+    "activity",
+    "time",
+    "doctor",
+    "group",
+)
+
+
+def _field_text(value):
+    return " ".join(str(value or "").split())
+
+
+def _compute_fingerprint(sec):
+    raw = "\x1f".join(_field_text(sec.get(field)) for field in FINGERPRINT_FIELDS)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _fingerprinted(sections):
+    for sec in sections.values():
+        sec["fingerprint"] = _compute_fingerprint(sec)
+    return sections
+
+
+def section_fingerprint(sec):
+    """Compact hash of a section's visible fields; stored at parse time, computed for
+    older records that lack one."""
+    return sec.get("fingerprint") or _compute_fingerprint(sec)
+
+
+def changed_fields(old, new):
+    """Visible fields whose normalized text differs between two versions of a section."""
+    return [
+        field
+        for field in FINGERPRINT_FIELDS
+        if _field_text(old.get(field)) != _field_text(new.get(field))
+    ]
+
+
+def _parse_tooltips(links):
     sections = {}
-    for link in soup.find_all(
-        "a", onclick=lambda x: x and "showToolTip(this,event," in x
-    ):
-        parts = re.findall(r"'([^']*)'", link.get("onclick", ""))
-        if len(parts) < 11:
-            continue
-        section_nums = parts[0].strip("-").split("-") if parts[0].strip("-") else []
-        section_ids = parts[1].strip("-").split("-") if parts[1].strip("-") else []
-        course_id = parts[6]
-        doctor_names = [d.strip() for d in parts[10].split("@-@-@") if d.strip()]
-        course_code, course_name = _course_from_row(link)
-        for idx, (sec_num, sec_id) in enumerate(zip(section_nums, section_ids)):
-            if not sec_id:
-                continue
-            doctor = doctor_names[idx] if idx < len(doctor_names) else "غير معروف"
-            sections[f"{course_id}_{sec_id}"] = {
-                "course_id": course_id,
-                "course_code": course_code,
-                "course_name": course_name,
-                "section_num": sec_num,
-                "section_id": sec_id,
-                "doctor": doctor,
-                "activity": "",
-                "time": "",
-                "group": "",
-            }
+    for link in links:
+        parts = _tooltip_parts(link.get("onclick", ""))
+        if parts:
+            _add_tooltip_sections(sections, parts, *_course_from_row(link))
     return sections
 
 
+def _tooltip_parts(onclick):
+    parts = _TOOLTIP_ARG_RE.findall(onclick)
+    return parts if len(parts) >= 11 else None
+
+
+def _add_tooltip_sections(sections, parts, course_code, course_name):
+    section_nums = parts[0].strip("-").split("-") if parts[0].strip("-") else []
+    section_ids = parts[1].strip("-").split("-") if parts[1].strip("-") else []
+    course_id = parts[6]
+    doctor_names = [d.strip() for d in parts[10].split("@-@-@") if d.strip()]
+    for idx, (sec_num, sec_id) in enumerate(zip(section_nums, section_ids)):
+        if not sec_id:
+            continue
+        doctor = doctor_names[idx] if idx < len(doctor_names) else "غير معروف"
+        sections[f"{course_id}_{sec_id}"] = {
+            "course_id": course_id,
+            "course_code": course_code,
+            "course_name": course_name,
+            "section_num": sec_num,
+            "section_id": sec_id,
+            "doctor": doctor,
+            "activity": "",
+            "time": "",
+            "group": "",
+        }
+
+
 def _course_from_row(link):
-    course_code = ""
-    course_name = ""
     parent_tr = link.find_parent("tr")
     if not parent_tr:
-        return course_code, course_name
-    for td in parent_tr.find_all("td"):
-        text = td.get_text(strip=True).replace("\xa0", " ").strip()
+        return "", ""
+    return _course_from_cells(td.get_text(strip=True) for td in parent_tr.find_all("td"))
+
+
+def _course_from_cells(cell_texts):
+    course_code = ""
+    course_name = ""
+    for text in cell_texts:
+        text = text.replace("\xa0", " ").strip()
         if re.match(r"^\d+\s+\S+$", text) and len(text) < 20:
             course_code = text
         elif (
@@ -729,18 +923,19 @@ def _course_from_row(link):
     return course_code, course_name
 
 
-def _parse_hidden(html):
-    soup = BeautifulSoup(html, "html.parser")
-    form = soup.find("form", {"name": "allData"})
-    if not form:
+def _parse_hidden(inputs):
+    if inputs is None:
         return {}
+    return _hidden_sections((inp.get("name") or "", inp.get("value") or "") for inp in inputs)
+
+
+def _hidden_sections(pairs):
     grouped = {}
-    for inp in form.find_all("input"):
-        name = inp.get("name") or ""
+    for name, value in pairs:
         for prefix in _HIDDEN_PREFIXES:
             if name.startswith(prefix) and len(name) > len(prefix):
                 suffix = name[len(prefix) :]
-                grouped.setdefault(suffix, {})[prefix] = inp.get("value") or ""
+                grouped.setdefault(suffix, {})[prefix] = value
                 break
     sections = {}
     for suffix, fields in grouped.items():
@@ -762,6 +957,309 @@ def _parse_hidden(html):
     return sections
 
 
+_TOOLTIP_ARG_RE = re.compile(r"'([^']*)'")
+_TOOLTIP_MARK = "showToolTip(this,event,"
+_ALLDATA_MARK = 'name="allData"'
+# Start/end tags the fast engine tracks. Quoted attribute values may hold ">".
+_SCAN_TAG_RE = re.compile(
+    r"<(/?)(tr|td|table|form|input|a)(?=[\s/>])((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>",
+    re.IGNORECASE,
+)
+_ANY_TAG_RE = re.compile(
+    r"<!--.*?-->|<[a-zA-Z/!?](?:[^>\"']|\"[^\"]*\"|'[^']*')*>", re.DOTALL
+)
+# get_text() leaves out script and style bodies; an unclosed one runs to the end.
+_RAW_TEXT_OPEN_RE = re.compile(r"<(?:script|style)\b", re.IGNORECASE)
+_RAW_TEXT_RE = re.compile(
+    r"<(script|style)\b[^>]*>.*?(?:</\1\s*>|$)", re.IGNORECASE | re.DOTALL
+)
+_NAME_ATTR_RE = re.compile(
+    r"""(?:^|\s)name\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))""", re.IGNORECASE
+)
+_VALUE_ATTR_RE = re.compile(
+    r"""(?:^|\s)value\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))""", re.IGNORECASE
+)
+_ATTR_RE = re.compile(
+    r"""([^\s"'=<>/`]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?"""
+)
+
+
+def _scan_attrs(raw):
+    attrs = {}
+    for match in _ATTR_RE.finditer(raw):
+        value = match.group(2)
+        if value is None:
+            value = match.group(3)
+        if value is None:
+            value = match.group(4) or ""
+        attrs[match.group(1).lower()] = html_lib.unescape(value) if "&" in value else value
+    return attrs
+
+
+def _scan_attr(raw, pattern):
+    match = pattern.search(raw)
+    if not match:
+        return ""
+    value = match.group(1)
+    if value is None:
+        value = match.group(2)
+    if value is None:
+        value = match.group(3) or ""
+    return html_lib.unescape(value) if "&" in value else value
+
+
+def _segment_strings(segment):
+    """Stripped text nodes of a raw HTML fragment, like get_text(strip=True) parts."""
+    if "<" in segment and _RAW_TEXT_OPEN_RE.search(segment):
+        segment = _RAW_TEXT_RE.sub(" ", segment)
+    out = []
+    for piece in _ANY_TAG_RE.split(segment):
+        if piece:
+            piece = html_lib.unescape(piece).strip() if "&" in piece else piece.strip()
+            if piece:
+                out.append(piece)
+    return out
+
+
+class _CatalogScanner:
+    """Tree-free catalog reader fed with text chunks.
+
+    Only tr/td/table/form/input/a tags are tokenized. Row cell texts are kept
+    as raw slices and only cleaned for rows that hold a tooltip anchor.
+    close() returns (tooltip_sections, hidden_sections) or None when the
+    result does not add up, so the caller can fall back to the tree parser.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._stack = []  # [name, data]; tr data = cell list, td data = raw slices
+        self._anchors = []  # [parts, code, name] in document order
+        self._inputs = None
+        self._form = ""  # "" not seen yet, "open" inside the first allData form, "done"
+        self._marks = 0
+        self._alldata_marks = 0
+        self.problem = ""
+
+    def feed(self, chunk):
+        buf = self._buf + chunk if self._buf else chunk
+        end = self._scan(buf)
+        self._buf = buf[end:]
+
+    def close(self):
+        if self._buf:
+            self._scan(self._buf, final=True)
+            self._buf = ""
+        while self._stack:
+            self._pop()
+        tips = {}
+        for parts, code, name in self._anchors:
+            _add_tooltip_sections(tips, parts, code, name)
+        hidden = _hidden_sections(self._inputs) if self._inputs is not None else {}
+        if self._marks != len(self._anchors):
+            self.problem = f"anchors={len(self._anchors)} marks={self._marks}"
+        elif self._alldata_marks and not self._form:
+            self.problem = "allData form not found"
+        elif (self._marks or self._alldata_marks) and not tips and not hidden:
+            self.problem = "no sections"
+        return None if self.problem else (tips, hidden)
+
+    def _scan(self, buf, final=False):
+        pos = 0
+        for match in _SCAN_TAG_RE.finditer(buf):
+            # The tag itself goes into open cells too, so text nodes stay split.
+            self._text(buf, pos, match.end())
+            self._tag(match)
+            pos = match.end()
+        if final:
+            self._text(buf, pos, len(buf))
+            pos = len(buf)
+        region = buf[:pos]
+        self._marks += region.count(_TOOLTIP_MARK)
+        self._alldata_marks += region.count(_ALLDATA_MARK)
+        return pos
+
+    def _text(self, buf, start, end):
+        if start < end:
+            piece = buf[start:end]
+            for name, data in self._stack:
+                if name == "td":
+                    data.append(piece)
+
+    def _tag(self, match):
+        closing, name, raw = match.groups()
+        name = name.lower()
+        if closing:
+            self._pop_to(name)
+            return
+        if name == "a":
+            if _TOOLTIP_MARK in raw:
+                parts = _tooltip_parts(_scan_attrs(raw).get("onclick") or "")
+                if parts:
+                    row = self._innermost("tr")
+                    anchor = [parts, "", ""]
+                    self._anchors.append(anchor)
+                    if row is not None:
+                        row["anchors"].append(anchor)
+            return
+        if name == "input":
+            if self._form == "open":
+                self._inputs.append((_scan_attr(raw, _NAME_ATTR_RE), _scan_attr(raw, _VALUE_ATTR_RE)))
+            return
+        if name == "form":
+            data = None
+            if not self._form and "allData" in raw:
+                if _scan_attrs(raw).get("name") == "allData":
+                    data = self._form = "open"
+                    self._inputs = []
+            self._stack.append(["form", data])
+        elif name == "tr":
+            self._stack.append(["tr", {"cells": [], "anchors": []}])
+        elif name == "td":
+            cell = []
+            for entry in self._stack:
+                if entry[0] == "tr":
+                    entry[1]["cells"].append(cell)
+            self._stack.append(["td", cell])
+        else:
+            self._stack.append([name, None])
+
+    def _innermost(self, name):
+        for entry in reversed(self._stack):
+            if entry[0] == name:
+                return entry[1]
+        return None
+
+    def _pop_to(self, name):
+        for idx in range(len(self._stack) - 1, -1, -1):
+            if self._stack[idx][0] == name:
+                while len(self._stack) > idx:
+                    self._pop()
+                return
+
+    def _pop(self):
+        name, data = self._stack.pop()
+        if name == "form" and data == "open":
+            self._form = "done"
+        elif name == "tr" and data["anchors"]:
+            code, course = _course_from_cells(
+                "".join(_segment_strings("".join(cell))) for cell in data["cells"]
+            )
+            for anchor in data["anchors"]:
+                anchor[1] = code
+                anchor[2] = course
+
+
+_ALLDATA_FORM_RE = re.compile(r"<form\b[^>]*\ballData\b.*?</form\s*>", re.IGNORECASE | re.DOTALL)
+_ROW_SPLIT_RE = re.compile(r"(?=<tr[\s>])", re.IGNORECASE)
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def _catalog_blocks(html):
+    """(tooltip row blocks, allData form text), or (None, None) when rows nest.
+
+    A block runs from one <tr to the next, which is the whole row as long
+    as rows do not hold nested tables.
+    """
+    form_match = _ALLDATA_FORM_RE.search(html)
+    form = form_match.group(0) if form_match else ""
+    if form and _ROW_SPLIT_RE.search(form):
+        return None, None
+    rows_html = html[: form_match.start()] + html[form_match.end() :] if form_match else html
+    blocks = []
+    for block in _ROW_SPLIT_RE.split(rows_html):
+        if _TOOLTIP_MARK not in block:
+            continue
+        lower = block.lower()
+        table_at = lower.find("<table")
+        close_at = lower.find("</tr")
+        if table_at != -1 and (close_at == -1 or table_at < close_at):
+            return None, None
+        blocks.append(block)
+    return blocks, form
+
+
+class IncrementalCatalogParser:
+    """Re-parse only the catalog rows that changed since the previous page.
+
+    Tooltip rows and the allData form are hashed as separate blocks; a
+    block whose hash was seen last time reuses its parsed sections. When
+    every block hash matches, the previous result is returned untouched and
+    changed is False, so callers can skip diffing.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._form = ("", {})
+        self._fingerprint = None
+        self._sections = None
+        self.stats = {"pages": 0, "unchanged": 0, "rows_parsed": 0, "rows_reused": 0}
+
+    def parse(self, html):
+        """Return (sections, changed)."""
+        self.stats["pages"] += 1
+        blocks, form = _catalog_blocks(html)
+        if blocks is None:
+            return self._full(html, "nested rows")
+        digests = [_digest(block) for block in blocks]
+        form_digest = _digest(form) if form else ""
+        fingerprint = _digest("".join(digests) + form_digest)
+        if fingerprint == self._fingerprint and self._sections:
+            self.stats["unchanged"] += 1
+            return self._sections, False
+        if config.EDUGATE_PARSER != "fast" or not blocks:
+            return self._full(html, "", fingerprint)
+
+        rows = {}
+        tips = {}
+        for digest, block in zip(digests, blocks):
+            parsed = rows.get(digest) or self._rows.get(digest)
+            if parsed is None:
+                scanner = _CatalogScanner()
+                scanner.feed(block)
+                result = scanner.close()
+                if result is None:
+                    return self._full(html, f"row: {scanner.problem}")
+                parsed = result[0]
+                self.stats["rows_parsed"] += 1
+            else:
+                self.stats["rows_reused"] += 1
+            rows[digest] = parsed
+            for key, sec in parsed.items():
+                tips[key] = dict(sec)
+
+        if form_digest and form_digest == self._form[0]:
+            hidden = self._form[1]
+        elif form:
+            scanner = _CatalogScanner()
+            scanner.feed(form)
+            result = scanner.close()
+            if result is None:
+                return self._full(html, f"form: {scanner.problem}")
+            hidden = result[1]
+        else:
+            hidden = {}
+
+        sections = _merge_sections(tips, hidden)
+        self._rows = rows
+        self._form = (form_digest, hidden)
+        self._fingerprint = fingerprint
+        self._sections = sections
+        return sections, True
+
+    def _full(self, html, reason, fingerprint=None):
+        if reason:
+            log.info("parse full  reason=%s", reason)
+        sections = parse_sections(html)
+        self._rows = {}
+        self._form = ("", {})
+        self._fingerprint = fingerprint
+        self._sections = sections
+        return sections, True
+
+
 def group_by_course(sections_list):
     courses = {}
     for sec in sections_list:
@@ -793,3 +1291,40 @@ def section_matches_course(sec, query):
 
 def filter_sections_for_course(sections, query):
     return {key: sec for key, sec in (sections or {}).items() if section_matches_course(sec, query)}
+
+
+def _course_terms(course_code, course_id):
+    """Every query string section_matches_course accepts for this code / id."""
+    code = _norm_course_query(course_code)
+    terms = {code, _norm_course_query(course_id), re.sub(r"\s+", "", code)}
+    terms.update(re.findall(r"[a-z0-9]+", code))
+    terms.discard("")
+    return terms
+
+
+class CourseIndex:
+    """section_matches_course as dict lookups, built once per catalog snapshot.
+
+    Maps normalized code, compact code, code tokens and course_id to section
+    keys. lookup(q) is index[q] | index[compact q], the same keys
+    filter_sections_for_course would return.
+    """
+
+    def __init__(self, sections):
+        self._keys = {}
+        terms_for = functools.lru_cache(maxsize=None)(_course_terms)
+        for key, sec in (sections or {}).items():
+            for term in terms_for(sec.get("course_code") or "", sec.get("course_id") or ""):
+                self._keys.setdefault(term, set()).add(key)
+
+    def lookup(self, query):
+        q = _norm_course_query(query)
+        if not q:
+            return frozenset()
+        exact = self._keys.get(q, ())
+        compact = self._keys.get(re.sub(r"\s+", "", q), ())
+        return frozenset(exact).union(compact)
+
+    def filter(self, sections, query):
+        """filter_sections_for_course(sections, query) for the indexed snapshot."""
+        return {key: sections[key] for key in self.lookup(query) if key in sections}
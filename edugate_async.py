@@ -0,0 +1,421 @@
+"""Asyncio Edugate client: EdugateClient's rules on a curl_cffi AsyncSession."""
+import asyncio
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from curl_cffi import CurlHttpVersion, CurlOpt
+from curl_cffi.requests import AsyncSession
+
+import config
+from edugate import (
+    BASE_URL,
+    COURSES_PATH,
+    CURL_IPRESOLVE_V4,
+    IMPERSONATE,
+    LOGIN_URL,
+    REGISTRATION_URL,
+    REQUEST_TIMEOUT,
+    RETRY_PAUSE,
+    SECTION_SERVLET,
+    _NETWORK_ERRORS,
+    _TIMEOUT_ERRORS,
+    _EdugateState,
+    _add_courses_target,
+    _add_courses_url,
+    _cookie_dict,
+    _exc_detail,
+    _host_proxy_urls,
+    _in_docker,
+    _log_dns,
+    _login_form,
+    _login_succeeded,
+    _looks_like_catalog,
+    _lookup_result,
+    _registration_form,
+    _stable_courses_url,
+    _viewstate,
+)
+
+log = logging.getLogger("edugate")
+
+
+def _make_async_session(http1=True, ipv4=True, cookies=None, proxy=None):
+    kwargs = {
+        "impersonate": IMPERSONATE,
+        "timeout": REQUEST_TIMEOUT,
+        "max_clients": config.EDUGATE_CONCURRENCY,
+    }
+    if http1:
+        kwargs["http_version"] = CurlHttpVersion.V1_1
+    if ipv4:
+        kwargs["curl_options"] = {CurlOpt.IPRESOLVE: CURL_IPRESOLVE_V4}
+    proxy = proxy or config.EDUGATE_PROXY
+    if proxy:
+        kwargs["proxy"] = proxy
+    session = AsyncSession(**kwargs)
+    session.headers["Accept-Language"] = "ar,en-US;q=0.9,en;q=0.8"
+    if cookies:
+        session.cookies.update(cookies)
+    return session
+
+
+class AsyncEdugateClient(_EdugateState):
+    """Same fetch_catalog / lookup_section answers as EdugateClient, but lookups
+    overlap: up to EDUGATE_CONCURRENCY requests are in flight at once.
+
+    Coroutines run on a private event loop thread and the blocking methods wait
+    on them, so bot.py threads can use either client. Catalog fetches, logins and
+    transport probes take one lock; lookups only wait for a login in progress.
+    """
+
+    def __init__(self, concurrency=None):
+        super().__init__()
+        self._concurrency = max(1, concurrency or config.EDUGATE_CONCURRENCY)
+        self._session_factory = lambda cookies: _make_async_session(
+            http1=True, ipv4=True, cookies=cookies
+        )
+        self._login_generation = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="edugate-async", daemon=True
+        )
+        self._thread.start()
+        self._run(self._setup())
+        log.info(
+            "http  docker=%s  proxy=%s  client=async concurrency=%s",
+            "yes" if _in_docker() else "no",
+            "yes" if config.EDUGATE_PROXY else "no",
+            self._concurrency,
+        )
+        self._run(self._pick_transport())
+        self._load_session()
+
+    async def _setup(self):
+        self._slots = asyncio.Semaphore(self._concurrency)
+        self._session_lock = asyncio.Lock()
+        self._session = self._session_factory({})
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    # Blocking facade, same signatures as EdugateClient.
+
+    def fetch_catalog(self, force=False):
+        """Return (sections_dict, error_or_none). Reuses cookies when possible."""
+        return self._run(self.afetch_catalog(force))
+
+    def lookup_section(self, section_id):
+        """Official add-box lookup. Returns a status dict. Never submits add."""
+        return self._run(self.alookup_section(section_id))
+
+    def lookup_many(self, section_ids):
+        """{section_id: result} for every id, looked up concurrently."""
+        return self._run(self.alookup_many(section_ids))
+
+    def close(self):
+        self._run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # Session handling.
+
+    async def _replace_session(self, factory, session):
+        """Swap in a new session once no lookup is using the old one."""
+        for _ in range(self._concurrency):
+            await self._slots.acquire()
+        try:
+            old, self._session = self._session, session
+            self._session_factory = factory
+        finally:
+            for _ in range(self._concurrency):
+                self._slots.release()
+        await self._close_quietly(old)
+
+    def _rebuild_session(self, failed):
+        """After a transport error on `failed`, swap in a fresh session with its
+        cookies, unless another task already has. Requests still running on the
+        old one keep it; it is closed once they have timed out."""
+        if self._session is not failed:
+            return
+        self._session = self._session_factory(_cookie_dict(failed))
+        self._loop.call_later(
+            REQUEST_TIMEOUT + RETRY_PAUSE, lambda: self._loop.create_task(self._close_quietly(failed))
+        )
+
+    @staticmethod
+    async def _close_quietly(session):
+        try:
+            await session.close()
+        except Exception:
+            pass
+
+    async def _try_factory(self, name, factory):
+        session = factory({})
+        try:
+            resp = await session.get(LOGIN_URL, timeout=15)
+            size = len(resp.content or b"")
+            if resp.status_code == 200 and size > 500:
+                await self._replace_session(factory, session)
+                self._reachable = True
+                log.info(
+                    "probe ok  transport=%s status=%s bytes=%s",
+                    name,
+                    resp.status_code,
+                    size,
+                )
+                return True
+            log.warning(
+                "probe skip  transport=%s status=%s bytes=%s",
+                name,
+                resp.status_code,
+                size,
+            )
+        except Exception as exc:
+            log.warning("probe fail  transport=%s %s", name, _exc_detail(exc))
+        try:
+            await session.close()
+        except Exception:
+            pass
+        return False
+
+    async def _pick_transport(self):
+        """EdugateClient's probe order minus the plain-requests fallback, which has no
+        asyncio flavour."""
+        self._reachable = False
+        strategies = [
+            (
+                "async curl chrome http1 ipv4",
+                lambda cookies: _make_async_session(http1=True, ipv4=True, cookies=cookies),
+            ),
+            (
+                "async curl chrome ipv4",
+                lambda cookies: _make_async_session(http1=False, ipv4=True, cookies=cookies),
+            ),
+            (
+                "async curl chrome http1",
+                lambda cookies: _make_async_session(http1=True, ipv4=False, cookies=cookies),
+            ),
+        ]
+        for name, factory in strategies:
+            if await self._try_factory(name, factory):
+                return
+            await asyncio.sleep(0.4)
+
+        if not config.EDUGATE_PROXY:
+            for proxy in _host_proxy_urls():
+                name = f"async curl chrome http1 ipv4 via {urlparse(proxy).hostname}"
+                factory = lambda cookies, proxy=proxy: _make_async_session(
+                    http1=True, ipv4=True, cookies=cookies, proxy=proxy
+                )
+                if await self._try_factory(name, factory):
+                    return
+                await asyncio.sleep(0.4)
+
+        _log_dns()
+        if _in_docker():
+            log.warning(
+                "probe none worked inside Docker — Edugate resets container traffic. "
+                "Run python bot.py on the host, or start python edugate_proxy.py on the host"
+            )
+        else:
+            log.warning("probe none worked, using async curl chrome http1 ipv4")
+        factory = strategies[0][1]
+        await self._replace_session(factory, factory({}))
+        self._reachable = False
+
+    async def _ensure_transport(self):
+        if self._reachable:
+            return
+        async with self._session_lock:
+            if not self._reachable:
+                await self._pick_transport()
+
+    async def _get(self, url, **kwargs):
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.setdefault("Referer", BASE_URL + "/")
+        session = self._session
+        try:
+            return await session.get(url, headers=headers, **kwargs)
+        except _NETWORK_ERRORS as exc:
+            log.warning(
+                "GET %s failed (%s), wait %.0fs then retry",
+                urlparse(url).path,
+                _exc_detail(exc),
+                RETRY_PAUSE,
+            )
+            await asyncio.sleep(RETRY_PAUSE)
+            self._rebuild_session(session)
+            return await self._session.get(url, headers=headers, **kwargs)
+
+    async def _post(self, url, **kwargs):
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.setdefault("Referer", url)
+        session = self._session
+        try:
+            return await session.post(url, headers=headers, **kwargs)
+        except _NETWORK_ERRORS as exc:
+            log.warning(
+                "POST %s failed (%s), wait %.0fs then retry",
+                urlparse(url).path,
+                _exc_detail(exc),
+                RETRY_PAUSE,
+            )
+            await asyncio.sleep(RETRY_PAUSE)
+            self._rebuild_session(session)
+            return await self._session.post(url, headers=headers, **kwargs)
+
+    # Catalog.
+
+    async def afetch_catalog(self, force=False):
+        async with self._session_lock:
+            started = time.time()
+            if not force:
+                skipped = self._catalog_backoff()
+                if skipped is not None:
+                    return skipped
+
+            if not self._reachable:
+                await self._pick_transport()
+            if not self._reachable:
+                self._trip_backoff()
+                log.warning(
+                    "catalog fail  error=ConnectionError backoff=%ss",
+                    self.backoff_remaining(),
+                )
+                return None, "ConnectionError"
+
+            had_cookies = bool(self._session.cookies)
+            html = await self._catalog_html_reused()
+            source = "session" if html else "login"
+            if html is None:
+                if had_cookies:
+                    await asyncio.sleep(RETRY_PAUSE)
+                html, error = await self._login_and_open_catalog()
+                if error:
+                    return self._catalog_failed(error)
+            # Parsing is CPU work; keep the loop free for lookups meanwhile. Only
+            # the parse leaves the loop: the session and backoff are loop state.
+            sections, changed = await self._loop.run_in_executor(None, self._parser.parse, html)
+            return self._catalog_accepted(sections, changed, source, started)
+
+    async def _catalog_html_reused(self):
+        if not self._session.cookies:
+            return None
+        url = _stable_courses_url(self._courses_url) or (BASE_URL + COURSES_PATH)
+        try:
+            resp = await self._get(url)
+            if _looks_like_catalog(resp.text):
+                self._courses_url = url
+                return resp.text
+            log.info("saved catalog url is stale, will re-login")
+            self._courses_url = None
+            return None
+        except _NETWORK_ERRORS as exc:
+            log.warning("saved catalog url dropped (%s)", type(exc).__name__)
+            self._courses_url = None
+            await asyncio.sleep(RETRY_PAUSE)
+        try:
+            html, next_url = await self._follow_add_courses()
+            if html and _looks_like_catalog(html):
+                self._courses_url = _stable_courses_url(next_url)
+                return html
+        except _NETWORK_ERRORS as exc:
+            log.warning("addCourses dropped (%s)", type(exc).__name__)
+        return None
+
+    async def _login_and_open_catalog(self):
+        """Call with _session_lock held."""
+        self._login_generation += 1
+        await self._replace_session(self._session_factory, self._session_factory({}))
+        self._courses_url = None
+        try:
+            viewstate = _viewstate((await self._get(LOGIN_URL)).text)
+            if not viewstate:
+                return None, "Could not find ViewState on login page"
+
+            login_response = await self._post(LOGIN_URL, data=_login_form(viewstate))
+            if not _login_succeeded(login_response):
+                return None, "Login failed — check EDUGATE credentials"
+
+            viewstate = _viewstate((await self._get(REGISTRATION_URL)).text)
+            if not viewstate:
+                return None, "Could not access registration page"
+
+            await self._post(REGISTRATION_URL, data=_registration_form(viewstate))
+
+            html, url = await self._follow_add_courses()
+            if not html:
+                return None, "Could not find courses page redirect"
+            self._courses_url = _stable_courses_url(url)
+            return html, None
+        except _TIMEOUT_ERRORS:
+            return None, "Connection timeout"
+        except _NETWORK_ERRORS as exc:
+            log.warning("login failed  %s", _exc_detail(exc))
+            return None, type(exc).__name__
+
+    async def _follow_add_courses(self):
+        url = _add_courses_target((await self._get(_add_courses_url())).text)
+        if not url:
+            return None, None
+        courses = await self._get(url)
+        return courses.text, url
+
+    # Lookups.
+
+    async def alookup_section(self, section_id):
+        section_id = str(section_id).strip()
+        await self._ensure_transport()
+        if not self._reachable:
+            return {"section_id": section_id, "status": "error", "error": "ConnectionError"}
+        generation = self._login_generation
+        result = await self._lookup_once(section_id)
+        if result.get("status") == "session_expired":
+            error = await self._relogin(section_id, generation)
+            if error:
+                log.error("lookup %s  re-login fail error=%s", section_id, error)
+                return {"section_id": section_id, "status": "error", "error": error}
+            result = await self._lookup_once(section_id)
+        if "backoff" in result:
+            return result
+        return self._lookup_logged(section_id, result)
+
+    async def alookup_many(self, section_ids):
+        ids = [str(section_id).strip() for section_id in section_ids]
+        results = await asyncio.gather(*(self.alookup_section(sid) for sid in ids))
+        return dict(zip(ids, results))
+
+    async def _relogin(self, section_id, generation):
+        """Log in again unless another task already did since `generation`."""
+        async with self._session_lock:
+            if self._login_generation != generation:
+                return None
+            log.info("lookup %s  session expired, re-login", section_id)
+            _html, error = await self._login_and_open_catalog()
+            return error
+
+    async def _lookup_once(self, section_id):
+        async with self._slots:
+            # Checked after the wait for a slot, so one busy answer stops the queue.
+            wait = self.backoff_remaining()
+            if wait:
+                return {"section_id": section_id, "status": "busy", "backoff": wait}
+            if not self._session.cookies:
+                return {"section_id": section_id, "status": "session_expired"}
+            try:
+                resp = await self._post(
+                    SECTION_SERVLET,
+                    params={"section": section_id, "index": "0"},
+                    data="",
+                    headers={
+                        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"
+                    },
+                )
+            except _TIMEOUT_ERRORS:
+                return {"section_id": section_id, "status": "error", "error": "timeout"}
+            except _NETWORK_ERRORS as exc:
+                return {"section_id": section_id, "status": "error", "error": type(exc).__name__}
+            return _lookup_result(section_id, resp)
@@ -7,85 +7,736 @@ your home network stack:
     python3 edugate_proxy.py
 
 Then the bot auto-tries http://172.17.0.1:18080 and host.docker.internal.
+
+Every tunnel runs on one selectors loop in a single thread; only DNS lookups
+go to a small thread pool. Answers are cached for --dns-ttl seconds, and the
+upstream connect races the resolved addresses Happy-Eyeballs style, trying
+addresses that recently failed or reset last. Ctrl+C or SIGTERM stops accepting
+and gives open tunnels --drain seconds to finish.
+
+--data-path picks how bytes move: splice (Linux, kernel pipe, no user-space
+copy), buffer (recv_into one preallocated buffer per direction) or copy (a new
+bytes object per recv). auto uses splice where os.splice exists, else buffer.
 """
 import argparse
+import errno
+import heapq
+import itertools
+import os
+import selectors
+import signal
 import socket
-import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 ALLOW_HOSTS = {"edugate.ksu.edu.sa"}
+ALLOW_PORTS = {443}
+BUF_SIZE = 65536
+MAX_HEADER = 8192
 
+_RESPONSES = {
+    403: b"HTTP/1.1 403 Forbidden\r\nConnection: close\r\n\r\n",
+    405: b"HTTP/1.1 405 Method Not Allowed\r\nConnection: close\r\n\r\n",
+    408: b"HTTP/1.1 408 Request Timeout\r\nConnection: close\r\n\r\n",
+    502: b"HTTP/1.1 502 Bad Gateway\r\nConnection: close\r\n\r\n",
+    503: b"HTTP/1.1 503 Service Unavailable\r\nConnection: close\r\n\r\n",
+    504: b"HTTP/1.1 504 Gateway Timeout\r\nConnection: close\r\n\r\n",
+}
+_ESTABLISHED = b"HTTP/1.1 200 Connection Established\r\n\r\n"
+_CONNECTING = {0, errno.EINPROGRESS, errno.EWOULDBLOCK}
 
-def _pump(src, dst):
+
+def _parse_connect(header):
+    """(host, port) from a CONNECT request head, or an HTTP status to refuse with."""
+    line = header.split(b"\r\n", 1)[0].decode("ascii", "replace")
+    parts = line.split()
+    if len(parts) < 2 or parts[0].upper() != "CONNECT":
+        return 405
+    host, _, port = parts[1].partition(":")
     try:
-        while True:
-            buf = src.recv(65536)
-            if not buf:
-                break
-            dst.sendall(buf)
-    except OSError:
+        port = int(port or "443")
+    except ValueError:
+        return 403
+    if host not in ALLOW_HOSTS or port not in ALLOW_PORTS:
+        return 403
+    return host, port
+
+
+class _Half:
+    """One direction of a tunnel: bytes read from src waiting to be written to dst.
+    This is the copy data path: every recv returns a new bytes object."""
+
+    __slots__ = ("src", "dst", "pending", "eof", "closed")
+
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+        self.pending = b""
+        self.eof = False
+        self.closed = False
+
+    def backlog(self):
+        return len(self.pending)
+
+    def wants_read(self):
+        return not self.eof and not self.backlog()
+
+    def wants_write(self):
+        return bool(self.backlog())
+
+    def release(self):
         pass
-    finally:
+
+    def read(self):
+        """Read once from src into pending. Returns bytes read."""
+        if not self.wants_read():
+            return 0
+        try:
+            data = self.src.recv(BUF_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        if not data:
+            self.eof = True
+            self._finish()
+            return 0
+        self.pending = data
+        return len(data)
+
+    def flush(self):
+        try:
+            sent = self.dst.send(self.pending) if self.pending else 0
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        self.pending = self.pending[sent:]
+        self._finish()
+        return sent
+
+    def _finish(self):
+        if self.eof and not self.backlog() and not self.closed:
+            self.closed = True
+            try:
+                self.dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+
+class _BufferHalf(_Half):
+    """recv_into one preallocated buffer; pending is a memoryview slice of it, so
+    a partial send re-slices instead of copying. The buffer is only refilled once
+    pending is empty."""
+
+    __slots__ = ("_buf",)
+
+    def __init__(self, src, dst):
+        super().__init__(src, dst)
+        self._buf = memoryview(bytearray(BUF_SIZE))
+
+    def read(self):
+        if not self.wants_read():
+            return 0
+        try:
+            received = self.src.recv_into(self._buf)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        if not received:
+            self.eof = True
+            self._finish()
+            return 0
+        self.pending = self._buf[:received]
+        return received
+
+
+class _SpliceHalf(_Half):
+    """src -> pipe -> dst with os.splice; the payload never enters user space.
+    `pending` only carries the proxy's own bytes (the 200 line, early client data),
+    which go out before anything in the pipe."""
+
+    __slots__ = ("_pipe_r", "_pipe_w", "_in_pipe")
+
+    _FLAGS = getattr(os, "SPLICE_F_MOVE", 0) | getattr(os, "SPLICE_F_NONBLOCK", 0)
+
+    def __init__(self, src, dst):
+        super().__init__(src, dst)
+        self._pipe_r, self._pipe_w = os.pipe()
+        os.set_blocking(self._pipe_r, False)
+        os.set_blocking(self._pipe_w, False)
+        self._in_pipe = 0
+
+    def backlog(self):
+        return len(self.pending) + self._in_pipe
+
+    def read(self):
+        if not self.wants_read():
+            return 0
+        try:
+            received = os.splice(self.src.fileno(), self._pipe_w, BUF_SIZE, flags=self._FLAGS)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        if not received:
+            self.eof = True
+            self._finish()
+            return 0
+        self._in_pipe = received
+        return received
+
+    def flush(self):
+        sent = super().flush() if self.pending else 0
+        if self.pending or not self._in_pipe:
+            return sent
+        try:
+            moved = os.splice(self._pipe_r, self.dst.fileno(), self._in_pipe, flags=self._FLAGS)
+        except (BlockingIOError, InterruptedError):
+            moved = 0
+        self._in_pipe -= moved
+        self._finish()
+        return sent + moved
+
+    def release(self):
+        for fd in (self._pipe_r, self._pipe_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+DATA_PATHS = {"copy": _Half, "buffer": _BufferHalf}
+if hasattr(os, "splice"):
+    DATA_PATHS["splice"] = _SpliceHalf
+
+
+def data_path(name):
+    """Half class for a --data-path value; auto = splice if available, else buffer."""
+    if name == "auto":
+        name = "splice" if "splice" in DATA_PATHS else "buffer"
+    if name not in DATA_PATHS:
+        raise ValueError(f"data path {name!r} is not available here")
+    return name, DATA_PATHS[name]
+
+
+def _interleave(addresses):
+    """Alternate address families, first family first (RFC 8305 section 4)."""
+    by_family = {}
+    for family, sockaddr in addresses:
+        by_family.setdefault(family, deque()).append((family, sockaddr))
+    queues = list(by_family.values())
+    ordered = []
+    while queues:
+        for queue in list(queues):
+            ordered.append(queue.popleft())
+            if not queue:
+                queues.remove(queue)
+    return ordered
+
+
+class _Resolver:
+    """getaddrinfo answers cached for `ttl` seconds, plus addresses to avoid.
+
+    Used from the loop thread only; lookups run on `pool` and come back through
+    Proxy._wake. Concurrent lookups of one name share a single getaddrinfo. A
+    failed refresh keeps serving the expired answer. An address that refused,
+    timed out or reset is tried after the others for `penalty` seconds.
+    """
+
+    def __init__(self, pool, notify, ttl, penalty):
+        self._pool = pool
+        self._notify = notify
+        self.ttl = ttl
+        self.penalty = penalty
+        self._cache = {}
+        self._waiting = {}
+        self._failed = {}
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host, port, callback, now):
+        """callback(addresses) now when cached, else once getaddrinfo returns."""
+        key = (host, port)
+        cached = self._cache.get(key)
+        if cached and now < cached[0]:
+            self.hits += 1
+            callback(self.order(cached[1], now))
+            return
+        self.misses += 1
+        waiters = self._waiting.get(key)
+        if waiters is not None:
+            waiters.append(callback)
+            return
+        self._waiting[key] = [callback]
+
+        def lookup():
+            try:
+                infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+                addresses = _interleave([(info[0], info[4]) for info in infos])
+            except OSError:
+                addresses = []
+            self._notify(key, addresses)
+
+        self._pool.submit(lookup)
+
+    def resolved(self, key, addresses, now):
+        """Store a finished lookup and answer everyone waiting for it."""
+        if addresses:
+            self._cache[key] = (now + self.ttl, addresses)
+        elif key in self._cache:
+            addresses = self._cache[key][1]
+        ordered = self.order(addresses, now)
+        for callback in self._waiting.pop(key, ()):
+            callback(list(ordered))
+
+    def order(self, addresses, now):
+        """Addresses with no recent failure first, each group in resolver order."""
+        for sockaddr in [a for a, until in self._failed.items() if until <= now]:
+            del self._failed[sockaddr]
+        good = [a for a in addresses if a[1] not in self._failed]
+        bad = sorted((a for a in addresses if a[1] in self._failed), key=lambda a: self._failed[a[1]])
+        return good + bad
+
+    def failed(self, sockaddr, now):
+        self._failed[sockaddr] = now + self.penalty
+
+    def succeeded(self, sockaddr):
+        self._failed.pop(sockaddr, None)
+
+
+class _Tunnel:
+    """A client connection: CONNECT head, then resolve and connect, then pumping."""
+
+    def __init__(self, proxy, client, now):
+        self.proxy = proxy
+        self.client = client
+        self.remote = None
+        self.state = "handshake"
+        self.header = b""
+        self.deadline = now + proxy.handshake_timeout
+        self.active = now
+        self.addresses = deque()
+        self.attempts = {}
+        self.stagger = None
+        self.remote_addr = None
+        self.io_sock = None
+        self.up = None
+        self.down = None
+        self.masks = {}
+
+    # selector bookkeeping
+
+    def _watch(self, sock, mask):
+        if self.masks.get(sock, 0) == mask:
+            return
+        selector = self.proxy.selector
+        if not mask:
+            selector.unregister(sock)
+            self.masks[sock] = 0
+        elif self.masks.get(sock):
+            selector.modify(sock, mask, self)
+            self.masks[sock] = mask
+        else:
+            selector.register(sock, mask, self)
+            self.masks[sock] = mask
+
+    def _update(self):
+        if self.state != "open":
+            return
+        for sock, reading, writing in (
+            (self.client, self.up, self.down),
+            (self.remote, self.down, self.up),
+        ):
+            mask = selectors.EVENT_READ if reading.wants_read() else 0
+            if writing.wants_write():
+                mask |= selectors.EVENT_WRITE
+            self._watch(sock, mask)
+        if self.up.closed and self.down.closed:
+            self.close()
+
+    # events
+
+    def on_event(self, sock, mask, now):
         try:
-            dst.shutdown(socket.SHUT_WR)
+            if self.state == "handshake":
+                self._read_header()
+            elif sock is self.client and self.state in {"resolving", "connecting"}:
+                self._read_early()
+            elif self.state == "connecting":
+                self._connected(sock, now)
+            elif self.state == "open":
+                self._pump(sock, mask, now)
+        except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+            # Only an upstream reset says anything about the address; a client
+            # hanging up mid-transfer must not push a healthy upstream down.
+            if self.state == "connecting" and sock in self.attempts:
+                self.proxy.resolver.failed(self.attempts[sock], now)
+            elif self.state == "open" and self.io_sock is self.remote:
+                self.proxy.resolver.failed(self.remote_addr, now)
+            self.fail(502)
         except OSError:
-            pass
+            self.fail(502)
+
+    def _read_header(self):
+        try:
+            chunk = self.client.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        if not chunk:
+            self.close()
+            return
+        self.header += chunk
+        if b"\r\n\r\n" not in self.header:
+            if len(self.header) > MAX_HEADER:
+                self.close()
+            return
+        target = _parse_connect(self.header)
+        if isinstance(target, int):
+            self.fail(target)
+            return
+        self.state = "resolving"
+        self.proxy.resolver.resolve(*target, self.resolved, time.monotonic())
 
+    def _read_early(self):
+        """The client stays watched while the upstream is found, so a hang-up
+        frees the tunnel at once. Bytes sent ahead of the 200 are kept for the
+        upstream; past MAX_HEADER of them the client is left unwatched until open."""
+        try:
+            chunk = self.client.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        if not chunk:
+            self.close()
+            return
+        self.header += chunk
+        if len(self.header) - self.header.index(b"\r\n\r\n") - 4 > MAX_HEADER:
+            self._watch(self.client, 0)
 
-def _handle(conn):
-    try:
-        header = b""
-        while b"\r\n\r\n" not in header:
-            chunk = conn.recv(4096)
-            if not chunk:
-                return
-            header += chunk
-            if len(header) > 8192:
-                return
-        line = header.split(b"\r\n", 1)[0].decode("ascii", "replace")
-        parts = line.split()
-        if len(parts) < 2 or parts[0].upper() != "CONNECT":
-            conn.sendall(b"HTTP/1.1 405 Method Not Allowed\r\nConnection: close\r\n\r\n")
+    def resolved(self, addresses):
+        """Called on the loop thread with ordered addresses (empty on failure)."""
+        if self.state != "resolving":
             return
-        host, _, port = parts[1].partition(":")
-        port = int(port or "443")
-        if host not in ALLOW_HOSTS or port != 443:
-            conn.sendall(b"HTTP/1.1 403 Forbidden\r\nConnection: close\r\n\r\n")
-            return
-        remote = socket.create_connection((host, port), timeout=20)
-        conn.sendall(b"HTTP/1.1 200 Connection Established\r\n\r\n")
-        leftover = header.split(b"\r\n\r\n", 1)[1]
-        if leftover:
-            remote.sendall(leftover)
-        thread = threading.Thread(target=_pump, args=(conn, remote), daemon=True)
-        thread.start()
-        _pump(remote, conn)
-        thread.join(timeout=60)
-        remote.close()
-    except OSError:
+        self.addresses.extend(addresses)
+        self.state = "connecting"
+        self._attempt()
+
+    def _attempt(self):
+        """Start connecting to the next address; if it has not finished within
+        connect_delay, the one after it starts too (Happy Eyeballs). One stagger
+        timer is pending at a time: starting an attempt early re-arms it."""
+        self.proxy.cancel(self.stagger)
+        self.stagger = None
+        if self.state != "connecting":
+            return
+        if not self.addresses:
+            if not self.attempts:
+                self.fail(502)
+            return
+        family, sockaddr = self.addresses.popleft()
         try:
-            conn.sendall(b"HTTP/1.1 502 Bad Gateway\r\nConnection: close\r\n\r\n")
+            sock = socket.socket(family, socket.SOCK_STREAM)
         except OSError:
-            pass
-    finally:
+            self._attempt()
+            return
+        sock.setblocking(False)
+        if sock.connect_ex(sockaddr) not in _CONNECTING:
+            # Refused or unreachable right away (e.g. no IPv6 route): next one now.
+            sock.close()
+            self.proxy.resolver.failed(sockaddr, time.monotonic())
+            self._attempt()
+            return
+        self.attempts[sock] = sockaddr
+        self._watch(sock, selectors.EVENT_WRITE)
+        if self.addresses:
+            self.stagger = self.proxy.call_later(self.proxy.connect_delay, self._attempt)
+
+    def _drop_attempt(self, sock):
+        self._watch(sock, 0)
+        del self.attempts[sock]
+        self.masks.pop(sock, None)
+        sock.close()
+
+    def _connected(self, sock, now):
+        sockaddr = self.attempts.get(sock)
+        if sockaddr is None:
+            return
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            self.proxy.resolver.failed(sockaddr, now)
+            self._drop_attempt(sock)
+            self._attempt()
+            return
+        self.proxy.resolver.succeeded(sockaddr)
+        self.proxy.cancel(self.stagger)
+        self.stagger = None
+        for other in list(self.attempts):
+            if other is not sock:
+                self._drop_attempt(other)
+        self._watch(sock, 0)
+        del self.attempts[sock]
+        self.remote = sock
+        self.remote_addr = sockaddr
+        self.state = "open"
+        self.up = self.proxy.half(self.client, self.remote)
+        self.down = self.proxy.half(self.remote, self.client)
+        self.up.pending = self.header.split(b"\r\n\r\n", 1)[1]
+        self.down.pending = _ESTABLISHED
+        self.header = b""
+        self.proxy.opened += 1
+        self._update()
+
+    def _pump(self, sock, mask, now):
+        sent = received = 0
+        if mask & selectors.EVENT_WRITE:
+            writer = self.up if sock is self.remote else self.down
+            self.io_sock = writer.dst
+            sent = writer.flush()
+        if mask & selectors.EVENT_READ:
+            reader = self.up if sock is self.client else self.down
+            self.io_sock = reader.src
+            received = reader.read()
+            self.io_sock = reader.dst
+            reader.flush()
+        if sent or received:
+            self.active = now
+            self.proxy.bytes += received
+        self._update()
+
+    # timeouts and teardown
+
+    def expired(self, now):
+        if self.state != "open":
+            return now >= self.deadline
+        return now - self.active >= self.proxy.idle_timeout
+
+    def fail(self, status):
+        if status == 504:
+            now = time.monotonic()
+            for sockaddr in self.attempts.values():
+                self.proxy.resolver.failed(sockaddr, now)
+        if self.state in {"handshake", "resolving", "connecting"}:
+            try:
+                self.client.send(_RESPONSES[status])
+            except OSError:
+                pass
+        self.close()
+
+    def close(self):
+        if self.state == "closed":
+            return
+        self.state = "closed"
+        self.proxy.cancel(self.stagger)
+        self.stagger = None
+        for half in (self.up, self.down):
+            if half is not None:
+                half.release()
+        for sock in (self.client, self.remote, *self.attempts):
+            if sock is None:
+                continue
+            if self.masks.get(sock):
+                self.proxy.selector.unregister(sock)
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self.proxy.tunnels.discard(self)
+
+
+class Proxy:
+    """CONNECT proxy multiplexing every tunnel on one selector."""
+
+    def __init__(
+        self,
+        bind,
+        port,
+        max_conns=64,
+        handshake_timeout=20.0,
+        idle_timeout=300.0,
+        drain=10.0,
+        data_path_name="auto",
+        dns_ttl=300.0,
+        connect_delay=0.25,
+        fail_penalty=60.0,
+    ):
+        self.data_path, self.half = data_path(data_path_name)
+        self.connect_delay = connect_delay
+        self.max_conns = max_conns
+        self.handshake_timeout = handshake_timeout
+        self.idle_timeout = idle_timeout
+        self.drain = drain
+        self.selector = selectors.DefaultSelector()
+        self.tunnels = set()
+        self.opened = 0
+        self.refused = 0
+        self.bytes = 0
+        self._stopping = None
+        self._done = deque()
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="resolve")
+        self.resolver = _Resolver(self._pool, self._resolved, dns_ttl, fail_penalty)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((bind, port))
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, "accept")
+
+    @property
+    def address(self):
+        return self.listener.getsockname()
+
+    def _resolved(self, key, addresses):
+        """From a resolver thread: hand the answer to the loop thread."""
+        self._done.append((key, addresses))
         try:
-            conn.close()
+            self._wake_w.send(b"\0")
         except OSError:
             pass
 
+    def call_later(self, delay, callback):
+        """Run callback on the loop thread after `delay` seconds; returns a handle
+        for cancel()."""
+        timer = [time.monotonic() + delay, next(self._timer_seq), callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        """Drop a call_later callback; it stays in the heap but never runs."""
+        if timer is not None:
+            timer[2] = None
+
+    def _run_timers(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            callback = heapq.heappop(self._timers)[2]
+            if callback is not None:
+                callback()
+
+    def stop(self, *_args):
+        """Stop accepting; open tunnels get `drain` seconds. Safe from a signal handler."""
+        if self._stopping is None:
+            self._stopping = time.monotonic()
+            try:
+                self._wake_w.send(b"\0")
+            except OSError:
+                pass
+
+    def _accept(self, now):
+        while True:
+            try:
+                conn, _addr = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.setblocking(False)
+            if len(self.tunnels) >= self.max_conns:
+                self.refused += 1
+                try:
+                    conn.send(_RESPONSES[503])
+                except OSError:
+                    pass
+                conn.close()
+                continue
+            tunnel = _Tunnel(self, conn, now)
+            self.tunnels.add(tunnel)
+            tunnel._watch(conn, selectors.EVENT_READ)
+
+    def _wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self._done:
+            key, addresses = self._done.popleft()
+            self.resolver.resolved(key, addresses, time.monotonic())
+
+    def _sweep(self, now):
+        for tunnel in [t for t in self.tunnels if t.expired(now)]:
+            tunnel.fail(408 if tunnel.state == "handshake" else 504)
+
+    def serve_forever(self):
+        last_sweep = time.monotonic()
+        while True:
+            if self._stopping is not None:
+                if self.listener.fileno() != -1:
+                    self.selector.unregister(self.listener)
+                    self.listener.close()
+                if not self.tunnels or time.monotonic() - self._stopping >= self.drain:
+                    break
+            timeout = 1.0
+            if self._timers:
+                timeout = min(timeout, max(0.0, self._timers[0][0] - time.monotonic()))
+            for key, mask in self.selector.select(timeout=timeout):
+                now = time.monotonic()
+                if key.data == "accept":
+                    self._accept(now)
+                elif key.data == "wake":
+                    self._wake()
+                else:
+                    key.data.on_event(key.fileobj, mask, now)
+            now = time.monotonic()
+            self._run_timers(now)
+            if now - last_sweep >= 1.0:
+                self._sweep(now)
+                last_sweep = now
+        for tunnel in list(self.tunnels):
+            tunnel.close()
+        self._pool.shutdown(wait=False)
+        self.selector.close()
+
 
 def main():
     parser = argparse.ArgumentParser(description="Host CONNECT proxy for Edugate")
     parser.add_argument("--bind", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--max-conns", type=int, default=64, help="open tunnels; more get 503")
+    parser.add_argument(
+        "--handshake-timeout", type=float, default=20.0, help="seconds for CONNECT + upstream connect"
+    )
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="seconds without traffic")
+    parser.add_argument("--drain", type=float, default=10.0, help="seconds tunnels get on shutdown")
+    parser.add_argument("--dns-ttl", type=float, default=300.0, help="seconds a DNS answer is reused")
+    parser.add_argument(
+        "--connect-delay",
+        type=float,
+        default=0.25,
+        help="seconds before racing the next upstream address",
+    )
+    parser.add_argument(
+        "--fail-penalty",
+        type=float,
+        default=60.0,
+        help="seconds a refused / reset address is tried last",
+    )
+    parser.add_argument(
+        "--data-path",
+        default="auto",
+        choices=["auto", "splice", "buffer", "copy"],
+        help="how tunnel bytes are moved (see module docstring)",
+    )
     args = parser.parse_args()
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind((args.bind, args.port))
-    sock.listen(32)
-    print(f"edugate proxy listening on {args.bind}:{args.port} (edugate.ksu.edu.sa only)")
-    while True:
-        conn, _addr = sock.accept()
-        threading.Thread(target=_handle, args=(conn,), daemon=True).start()
+    proxy = Proxy(
+        args.bind,
+        args.port,
+        max_conns=args.max_conns,
+        handshake_timeout=args.handshake_timeout,
+        idle_timeout=args.idle_timeout,
+        drain=args.drain,
+        data_path_name=args.data_path,
+        dns_ttl=args.dns_ttl,
+        connect_delay=args.connect_delay,
+        fail_penalty=args.fail_penalty,
+    )
+    signal.signal(signal.SIGINT, proxy.stop)
+    signal.signal(signal.SIGTERM, proxy.stop)
+    print(
+        f"edugate proxy listening on {args.bind}:{args.port} (edugate.ksu.edu.sa only, "
+        f"max {args.max_conns} tunnels, {proxy.data_path} data path)"
+    )
+    proxy.serve_forever()
+    print(
+        f"edugate proxy stopped: {proxy.opened} tunnels, {proxy.refused} refused, "
+        f"{proxy.bytes / 1e6:.1f} MB, DNS {proxy.resolver.hits} cached / "
+        f"{proxy.resolver.misses} looked up"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""Slow-lane executor for commands that wait on Edugate."""
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("lanes")
+
+
+class SlowLane:
+    """Runs submitted jobs on `workers` threads with at most `limit` waiting.
+
+    Telegram handler threads only enqueue here, so commands that answer from
+    local state never queue behind an Edugate request. Each chat may have one
+    job waiting or running at a time.
+    """
+
+    def __init__(self, workers, limit, history=200):
+        self._workers = max(1, workers)
+        self._limit = max(1, limit)
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._chats = set()
+        self._running = 0
+        self._waits = deque(maxlen=history)
+        self.done = 0
+        self.rejected = 0
+
+    def submit(self, chat_id, fn, *args):
+        """{"status": "queued", "position": n} (n jobs must start before this one;
+        0 = a worker is free), or {"status": "full"} / {"status": "duplicate"}."""
+        with self._cond:
+            if chat_id in self._chats:
+                self.rejected += 1
+                return {"status": "duplicate"}
+            if len(self._queue) >= self._limit:
+                self.rejected += 1
+                return {"status": "full"}
+            self._queue.append((time.time(), chat_id, fn, args))
+            self._chats.add(chat_id)
+            self._cond.notify()
+            position = max(0, len(self._queue) - (self._workers - self._running))
+        return {"status": "queued", "position": position}
+
+    def stats(self):
+        with self._cond:
+            waits = list(self._waits)
+            return {
+                "queued": len(self._queue),
+                "running": self._running,
+                "done": self.done,
+                "rejected": self.rejected,
+                "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+                "wait_max": max(waits) if waits else 0.0,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                queued_at, chat_id, fn, args = self._queue.popleft()
+                self._running += 1
+                self._waits.append(time.time() - queued_at)
+            try:
+                fn(*args)
+            except Exception:
+                log.exception("slow job crash  chat=%s job=%s", chat_id, getattr(fn, "__name__", fn))
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._chats.discard(chat_id)
+                    self.done += 1
+
+    def start(self):
+        for number in range(self._workers):
+            threading.Thread(target=self._run, name=f"slow-{number}", daemon=True).start()
@@ -0,0 +1,168 @@
+"""Rendered /sections listings, kept for the latest catalog version."""
+import hashlib
+import logging
+import threading
+import time
+
+from edugate import group_by_course
+
+log = logging.getLogger("listings")
+
+# Distinct queries kept per version; the oldest is dropped past this.
+_LISTING_LIMIT = 256
+# Query references kept for page buttons; the oldest is dropped past this.
+_REF_LIMIT = 4096
+# Page body size; leaves room under Telegram's 4096 for the header.
+PAGE_CHARS = 3500
+
+
+class Listing:
+    """A rendered listing: one Markdown block per course, in course-code order."""
+
+    __slots__ = ("version", "query", "count", "blocks", "_pages")
+
+    def __init__(self, version, query, count, blocks):
+        self.version = version
+        self.query = query
+        self.count = count
+        self.blocks = blocks
+        self._pages = {}
+
+    def pages(self, limit=PAGE_CHARS):
+        """Blocks packed into pages of at most `limit` characters. A page only ends
+        between lines, so Markdown entities are never cut; built on first use."""
+        pages = self._pages.get(limit)
+        if pages is None:
+            pages = self._pages[limit] = tuple(_pack(self.blocks, limit)) or ("",)
+        return pages
+
+
+def _pack(blocks, limit):
+    page = []
+    size = 0
+    for block in blocks:
+        pieces = [block] if len(block) <= limit else block.splitlines(keepends=True)
+        for piece in pieces:
+            if page and size + len(piece) > limit:
+                yield "".join(page)
+                page, size = [], 0
+            page.append(piece)
+            size += len(piece)
+    if page:
+        yield "".join(page)
+
+
+class ListingCache:
+    """Listings keyed on (catalog version, normalized query).
+
+    section_line(sec) and course_heading(code, name) render the Markdown; each
+    section's line is rendered once per version and reused by every query that
+    lists it. A newer version drops everything; listings for an older version
+    (a stale /sections answer) are rendered but not kept.
+
+    ref(query) gives a short stable token for a query, for button data too small
+    to carry the query itself; query(ref) maps it back. References outlive
+    catalog versions but not a restart.
+    """
+
+    def __init__(self, section_line, course_heading):
+        self._section_line = section_line
+        self._course_heading = course_heading
+        self._lock = threading.Lock()
+        self._version = None
+        self._lines = {}
+        self._order = None
+        self._listings = {}
+        self._refs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, sections, query="", index=None):
+        """Listing of `sections` (the whole snapshot of `version`), filtered through
+        index.filter when query is set."""
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._version = version
+                self._lines = {}
+                self._order = None
+                self._listings = {}
+            current = version == self._version
+            lines = self._lines if current else {}
+            listing = self._listings.get(query) if current else None
+            if listing is not None:
+                self.hits += 1
+                return listing
+            self.misses += 1
+        started = time.perf_counter()
+        if query:
+            matched = index.filter(sections, query)
+            order = self._positions(version, sections) if current else None
+            keys = sorted(matched, key=order.get) if order else list(matched)
+            chosen = {key: matched[key] for key in keys}
+        else:
+            chosen = sections
+        listing = Listing(version, query, len(chosen), self._render(chosen, lines))
+        log.info(
+            "listing render  v=%s query=%s sections=%s ms=%s",
+            version,
+            query or "-",
+            listing.count,
+            int((time.perf_counter() - started) * 1000),
+        )
+        if current:
+            with self._lock:
+                if version == self._version:
+                    if len(self._listings) >= _LISTING_LIMIT:
+                        self._listings.pop(next(iter(self._listings)))
+                    self._listings[query] = listing
+        return listing
+
+    def ref(self, query):
+        ref = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            if ref not in self._refs and len(self._refs) >= _REF_LIMIT:
+                self._refs.pop(next(iter(self._refs)))
+            self._refs[ref] = query
+        return ref
+
+    def query(self, ref):
+        """The query behind ref, or None when it was dropped or predates a restart."""
+        with self._lock:
+            return self._refs.get(ref)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self._version,
+                "listings": len(self._listings),
+                "lines": len(self._lines),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _positions(self, version, sections):
+        """{key: position in the snapshot}, so filtered listings keep catalog order."""
+        with self._lock:
+            if self._order is not None and version == self._version:
+                return self._order
+        order = {key: position for position, key in enumerate(sections)}
+        with self._lock:
+            if version == self._version:
+                self._order = order
+        return order
+
+    def _render(self, sections, lines):
+        """One block per course; lines is the {key: line} memo of the version."""
+        by_id = {id(sec): key for key, sec in sections.items()}
+        blocks = []
+        for code, info in sorted(group_by_course(list(sections.values())).items()):
+            parts = [self._course_heading(code, info["name"])]
+            for sec in info["sections"]:
+                key = by_id[id(sec)]
+                line = lines.get(key)
+                if line is None:
+                    line = lines[key] = self._section_line(sec)
+                parts.append(line)
+            parts.append("\n")
+            blocks.append("".join(parts))
+        return tuple(blocks)
@@ -0,0 +1,97 @@
+"""Section lookups shared across chats: a short result cache plus single-flight."""
+import logging
+import threading
+import time
+
+log = logging.getLogger("lookups")
+
+# Only final answers are reused; busy and error results are never cached.
+_CACHEABLE = {"open", "not_found", "unavailable"}
+
+
+class LookupCoalescer:
+    """Each section id goes to Edugate at most once per `ttl` seconds.
+
+    A chat asking for an id that another thread is already looking up waits
+    for that answer instead of sending its own request. `sent` counts
+    requests passed to the client, `saved` counts answers served without one.
+    """
+
+    def __init__(self, client, ttl):
+        self._client = client
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._results = {}
+        self._inflight = {}
+        self.sent = 0
+        self.saved = 0
+
+    def lookup_many(self, section_ids):
+        """{section_id: result} like the client's lookup_many, shared across callers."""
+        ids = list(dict.fromkeys(str(section_id).strip() for section_id in section_ids))
+        results = {}
+        mine = []
+        waits = {}
+        now = time.time()
+        with self._lock:
+            for section_id in ids:
+                cached = self._results.get(section_id)
+                if cached and cached[1].get("status") in _CACHEABLE and now - cached[0] < self._ttl:
+                    results[section_id] = dict(cached[1])
+                elif section_id in self._inflight:
+                    waits[section_id] = self._inflight[section_id]
+                else:
+                    self._inflight[section_id] = threading.Event()
+                    mine.append(section_id)
+            self.saved += len(ids) - len(mine)
+            self.sent += len(mine)
+
+        fetched = {}
+        if mine:
+            try:
+                fetched = self._client.lookup_many(mine)
+            finally:
+                self._publish(mine, fetched)
+        results.update(fetched)
+
+        for section_id, event in waits.items():
+            event.wait()
+            with self._lock:
+                shared = self._results.get(section_id)
+            if shared is not None:
+                results[section_id] = dict(shared[1])
+
+        for section_id in ids:
+            if section_id not in results:
+                results[section_id] = self._skipped(section_id)
+        log.info(
+            "lookup coalesce  asked=%s sent=%s shared=%s",
+            len(ids),
+            len(mine),
+            len(ids) - len(mine),
+        )
+        return results
+
+    def _publish(self, section_ids, fetched):
+        now = time.time()
+        with self._lock:
+            for section_id, (fetched_at, _result) in list(self._results.items()):
+                if now - fetched_at >= self._ttl:
+                    del self._results[section_id]
+            for section_id in section_ids:
+                if section_id in fetched:
+                    self._results[section_id] = (now, fetched[section_id])
+                else:
+                    self._results.pop(section_id, None)
+                self._inflight.pop(section_id).set()
+
+    def _skipped(self, section_id):
+        """Stand-in for an id the client never reached (it stops after a busy answer)."""
+        wait = self._client.backoff_remaining()
+        if wait:
+            return {"section_id": section_id, "status": "busy", "backoff": wait}
+        return {"section_id": section_id, "status": "error", "error": "skipped"}
+
+    def stats(self):
+        with self._lock:
+            return {"sent": self.sent, "saved": self.saved, "cached": len(self._results)}
@@ -0,0 +1,107 @@
+"""Check timer: a heap keyed on due time and one thread sleeping until the next."""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("sched")
+
+
+class CheckScheduler:
+    """Calls check(key) when each key comes due, then asks next_delay(key) for the
+    wait until its next run (None drops the key). Keys are chat ids, or bucket
+    names in catalog-cycle mode. `name` names the thread start() runs it on.
+
+    schedule() and cancel() notify the thread, so /start, /interval and /logout
+    take effect without rescanning every chat. Replaced heap entries are not
+    removed; they are skipped when popped because their seq is no longer the
+    key's current one.
+    """
+
+    def __init__(self, check, next_delay, history=200, name="scheduler"):
+        self._check = check
+        self._name = name
+        self._next_delay = next_delay
+        self._cond = threading.Condition()
+        self._heap = []
+        self._current = {}
+        self._seq = itertools.count()
+        self._lateness = deque(maxlen=history)
+        self.checks = 0
+
+    def schedule(self, key, delay):
+        """(Re)schedule key `delay` seconds from now, replacing any pending run."""
+        with self._cond:
+            seq = next(self._seq)
+            self._current[key] = seq
+            heapq.heappush(self._heap, (time.time() + max(0, delay), seq, key))
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._current.pop(key, None)
+            self._cond.notify()
+
+    def pending(self, key):
+        with self._cond:
+            return key in self._current
+
+    def depth(self):
+        with self._cond:
+            return len(self._current)
+
+    def stats(self):
+        """Queue depth plus lateness (seconds past due) of recent checks."""
+        with self._cond:
+            late = list(self._lateness)
+            return {
+                "depth": len(self._current),
+                "heap": len(self._heap),
+                "checks": self.checks,
+                "late_last": late[-1] if late else 0.0,
+                "late_avg": sum(late) / len(late) if late else 0.0,
+                "late_max": max(late) if late else 0.0,
+            }
+
+    def _pop_due(self):
+        """Block until an entry is due; return (due, seq, key). Call with _cond held."""
+        while True:
+            while self._heap and self._current.get(self._heap[0][2]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._cond.wait()
+                continue
+            wait = self._heap[0][0] - time.time()
+            if wait <= 0:
+                return heapq.heappop(self._heap)
+            self._cond.wait(wait)
+
+    def run(self):
+        while True:
+            with self._cond:
+                due, seq, key = self._pop_due()
+            late = max(0.0, time.time() - due)
+            with self._cond:
+                self._lateness.append(late)
+                self.checks += 1
+            log.info("sched run  key=%s late_ms=%s depth=%s", key, int(late * 1000), self.depth())
+            try:
+                self._check(key)
+            except Exception:
+                log.exception("check crash  key=%s", key)
+            delay = self._next_delay(key)
+            with self._cond:
+                if self._current.get(key) != seq:
+                    continue
+                if delay is None:
+                    del self._current[key]
+                    continue
+                self._current[key] = seq = next(self._seq)
+                heapq.heappush(self._heap, (time.time() + delay, seq, key))
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name=self._name, daemon=True)
+        thread.start()
+        return thread
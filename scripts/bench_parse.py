@@ -0,0 +1,457 @@
+"""Time catalog parsing on a saved Edugate page or a synthetic one.
+
+    python scripts/bench_parse.py saved_catalog.html
+    python scripts/bench_parse.py --synthetic 3000
+    python scripts/bench_parse.py --merge 10000
+    python scripts/bench_parse.py --index 5000
+    python scripts/bench_parse.py --listing 5000
+    python scripts/bench_parse.py --check
+
+--check runs known merge cases against the old merge and known _clean
+cases against get_text, and exits 1 on a mismatch. Only the parse is timed; nothing talks to Edugate.
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+for _name, _value in (
+    ("BOT_TOKEN", "bench"),
+    ("ADMIN_ID", "0"),
+    ("EDUGATE_USERNAME", "bench"),
+    ("EDUGATE_PASSWORD", "bench"),
+):
+    os.environ.setdefault(_name, _value)
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import edugate  # noqa: E402
+import listings  # noqa: E402
+
+_DOCTORS = ["أحمد محمد", "سارة علي", "خالد عبدالله", "نورة سعد", "فهد إبراهيم"]
+_ACTIVITIES = ["محاضرة", "تمارين", "عملي"]
+
+
+def synthetic_catalog(sections, seed=7):
+    """Catalog-shaped HTML: one row per course, a tooltip anchor, allData inputs."""
+    rng = random.Random(seed)
+    rows = []
+    hidden = []
+    sec_id = 40000
+    course = 0
+    made = 0
+    while made < sections:
+        course += 1
+        course_id = str(1000 + course)
+        count = min(rng.randint(1, 12), sections - made)
+        nums = [str(rng.choice([1, 2, 3, 171, 172, 173, rng.randint(1, 400)])) for _ in range(count)]
+        ids = [str(sec_id + i) for i in range(count)]
+        sec_id += count
+        doctors = "@-@-@".join(rng.choice(_DOCTORS) for _ in range(count))
+        code = f"{100 + course % 400} {rng.choice(['عال', 'ريض', 'فيز', 'كيم'])}"
+        name = f"مقرر تجريبي رقم {course}"
+        onclick = (
+            f"showToolTip(this,event,'-{'-'.join(nums)}-','-{'-'.join(ids)}-',"
+            f"'x','y','z','w','{course_id}','a','b','c','{doctors}')"
+        )
+        rows.append(
+            f'<tr class="ROW{course % 2}"><td><input type="checkbox" name="c{course}"/></td>'
+            f'<td>&nbsp;{code}</td><td><span class="crsName">{name}</span></td>'
+            f"<td>3</td><td>إجبارية</td>"
+            f'<td><a href="#" onclick="{onclick}"><img src="/i.gif"/> الشعب</a></td></tr>'
+        )
+        for idx, (num, _sid) in enumerate(zip(nums, ids)):
+            suffix = f"{course_id}_{idx}"
+            hidden.append(
+                f'<input type="hidden" name="crsName{suffix}" value="{name}"/>'
+                f'<input type="hidden" name="crsSec{suffix}" value="{num}"/>'
+                f'<input type="hidden" name="crsActv{suffix}" value="{rng.choice(_ACTIVITIES)}"/>'
+                f'<input type="hidden" name="groupTypeDesc{suffix}" value="طلاب"/>'
+                f'<input type="hidden" name="time{suffix}" '
+                f'value="الأحد@t08:00 - 08:50@n&lt;b&gt;الثلاثاء&lt;/b&gt;@t10:00 - 10:50"/>'
+                f'<input type="hidden" name="inst{suffix}" value="{rng.choice(_DOCTORS)}"/>'
+            )
+        made += count
+    menu = "".join(f'<li><a href="/m{i}">قائمة {i}</a></li>' for i in range(200))
+    return (
+        "<html><head><title>المقررات</title><style>td{padding:2px}</style></head><body>"
+        f"<ul>{menu}</ul><table id=\"courses\">{''.join(rows)}</table>"
+        f"<form name=\"allData\" method=\"post\">{''.join(hidden)}</form></body></html>"
+    )
+
+
+def _soup_clean(text):
+    return BeautifulSoup(str(text), "html.parser").get_text(" ", strip=True) if text else ""
+
+
+def _legacy_two_trees(html):
+    """The old parse: a separate html.parser tree for tooltips and for hidden
+    fields, a soup per cleaned field and the old merge."""
+    fast_clean = edugate._clean
+    edugate._clean = _soup_clean
+    try:
+        return _two_trees(html)
+    finally:
+        edugate._clean = fast_clean
+
+
+def _two_trees(html):
+    links, _ = edugate._scan_catalog(BeautifulSoup(html, "html.parser"))
+    _, inputs = edugate._scan_catalog(BeautifulSoup(html, "html.parser"))
+    return _legacy_merge(edugate._parse_tooltips(links), edugate._parse_hidden(inputs))
+
+
+def _check_clean(html):
+    """Compare the tree-free _clean with BeautifulSoup get_text on every hidden value."""
+    scanner = edugate._CatalogScanner()
+    scanner.feed(html)
+    scanner.close()
+    values = {value for _name, value in scanner._inputs or ()}
+    values |= {value.replace("@n", " | ").replace("@t", " ").replace("@r", " ") for value in values}
+    diffs = [
+        value
+        for value in values
+        if edugate._clean(value) != _soup_clean(value)
+    ]
+    print(f"  _clean vs get_text: {len(values)} distinct values, {len(diffs)} differ")
+    for value in diffs[:5]:
+        print(f"    {value!r}")
+
+
+def _legacy_merge(from_tip, from_hidden):
+    """The merge step of the old parse_sections, verbatim: rebuild the candidate
+    list per tooltip row, then substring-match course names."""
+    if not from_tip and not from_hidden:
+        return {}
+    if not from_tip:
+        return from_hidden
+    hidden_by_num = {}
+    for sec in from_hidden.values():
+        hidden_by_num.setdefault(str(sec.get("section_num", "")), []).append(sec)
+
+    used = set()
+    for key, sec in from_tip.items():
+        cands = [
+            h
+            for h in hidden_by_num.get(str(sec.get("section_num", "")), [])
+            if id(h) not in used
+        ]
+        match = None
+        if len(cands) == 1:
+            match = cands[0]
+        elif cands and sec.get("course_name"):
+            for h in cands:
+                if h.get("course_name") and (
+                    h["course_name"] in sec["course_name"]
+                    or sec["course_name"] in h["course_name"]
+                ):
+                    match = h
+                    break
+        if match is None and cands:
+            match = cands[0]
+        if match:
+            used.add(id(match))
+            for field in ("course_name", "course_code", "activity", "time", "doctor", "group"):
+                if match.get(field) and not sec.get(field):
+                    sec[field] = match[field]
+                elif match.get(field) and field in ("activity", "time", "group"):
+                    sec[field] = match[field]
+            if match.get("doctor") and (not sec.get("doctor") or sec.get("doctor") == "غير معروف"):
+                sec["doctor"] = match["doctor"]
+            if match.get("course_name"):
+                sec["course_name"] = match["course_name"]
+    return from_tip
+
+
+def _merge_diffs(result, reference):
+    """Section keys whose user-visible fields differ between two merges."""
+    return [
+        key
+        for key in reference
+        if key not in result
+        or any(
+            result[key].get(field) != reference[key].get(field) for field in edugate.FINGERPRINT_FIELDS
+        )
+    ]
+
+
+def _repeated_numbers(sections, misaligned=0.2, seed=7):
+    """Tooltip / hidden dicts where every course numbers its sections from 1, so
+    each section number is shared by most courses. A `misaligned` share of the
+    courses has hidden rows under another course_id and a longer course name,
+    which sends those sections to the similar-name step."""
+    rng = random.Random(seed)
+    tips = {}
+    hidden = {}
+    names = {}
+    course = 0
+    while len(tips) < sections:
+        course += 1
+        course_id = str(1000 + course)
+        name = f"مقرر {course:05d}"
+        off = rng.random() < misaligned
+        names[course_id] = f"{name} (عملي)" if off else name
+        for number in range(1, min(rng.randint(1, 4), sections - len(tips)) + 1):
+            sec_id = f"{course_id}{number}"
+            tips[f"{course_id}_{sec_id}"] = _tip(course_id, str(number), name)
+            row = _row(f"x{course_id}" if off else course_id, str(number), names[course_id], sec_id)
+            hidden[f"{row['course_id']}_{number}"] = row
+    return tips, hidden, names
+
+
+def bench_merge(sections, rounds):
+    """Merge-only timing on synthetic tooltip/hidden dicts (no HTML involved)."""
+    scanner = edugate._CatalogScanner()
+    scanner.feed(synthetic_catalog(sections))
+    tips, hidden = scanner.close()
+    names = {sec["course_id"]: sec["course_name"] for sec in hidden.values()}
+    scenarios = [("scanned synthetic page", tips, hidden, names)]
+    scenarios.append(("repeated section numbers, 20% misaligned", *_repeated_numbers(sections)))
+    for title, tips, hidden, names in scenarios:
+        print(f"merge only, {title}: {len(tips)} tooltip + {len(hidden)} hidden sections")
+        reference = _legacy_merge(copy.deepcopy(tips), copy.deepcopy(hidden))
+        for label, fn in (("before: candidate lists", _legacy_merge), ("indexed buckets", edugate._merge_sections)):
+            best = None
+            for _ in range(rounds):
+                args = (copy.deepcopy(tips), copy.deepcopy(hidden))
+                started = time.perf_counter()
+                result = fn(*args)
+                spent = time.perf_counter() - started
+                best = spent if best is None else min(best, spent)
+            wrong = sum(1 for sec in result.values() if sec["course_name"] != names[sec["course_id"]])
+            differ = len(_merge_diffs(result, reference))
+            print(f"  {label:<30} {best * 1000:8.1f} ms  wrong course={wrong} differ from before={differ}")
+
+
+def _tip(course_id, num, name):
+    return {"course_id": course_id, "section_num": num, "course_name": name, "doctor": "غير معروف"}
+
+
+def _row(suffix, num, name, time_text):
+    return {
+        "course_id": suffix,
+        "section_num": num,
+        "course_name": name,
+        "activity": "محاضرة",
+        "time": time_text,
+        "doctor": f"doctor {time_text}",
+    }
+
+
+# (label, tooltip sections, hidden sections, {tooltip key: expected time}).
+_MERGE_CASES = [
+    (
+        "course_id matches",
+        {"1": _tip("A", "1", "Calculus"), "2": _tip("B", "1", "Physics")},
+        {"h1": _row("B", "1", "Physics", "tB"), "h2": _row("A", "1", "Calculus", "tA")},
+        {"1": "tA", "2": "tB"},
+    ),
+    (
+        "course_id misaligned, names differ slightly",
+        {"1": _tip("A", "1", "Calculus I"), "2": _tip("B", "1", "Physics I")},
+        {"h1": _row("x9", "1", "Physics I (lab)", "tB"), "h2": _row("x8", "1", "Calculus I (lab)", "tA")},
+        {"1": "tA", "2": "tB"},
+    ),
+    (
+        "course_id misaligned, no name clue",
+        {"1": _tip("A", "7", "")},
+        {"h1": _row("x9", "7", "Statistics", "tS")},
+        {"1": "tS"},
+    ),
+]
+
+
+# Fragments where _clean must agree with get_text(" ", strip=True).
+_CLEAN_SAME = [
+    "<script>var x=1</script>hi",
+    "<SCRIPT type='x'>1<2</SCRIPT>ok",
+    "<style>td{padding:2px}</style> a <b>b</b>",
+    "a<script>x",
+    "<!-- note -->t",
+    "<td>&nbsp;101 عال</td>",
+    "x &lt;b&gt; y",
+    "a&amp;b",
+    "A & B",
+    "&#65;&#x42;",
+]
+# Malformed references: html.unescape on purpose, see edugate._clean.
+_CLEAN_EXPECTED = {"A&B": "A&B", "AT&T;": "AT&T;", "&copy2": "©2"}
+
+
+def check_clean():
+    """_clean on known fragments. Returns the number of failures."""
+    failures = 0
+    cases = [(text, _soup_clean(text)) for text in _CLEAN_SAME] + list(_CLEAN_EXPECTED.items())
+    for text, expected in cases:
+        got = edugate._clean(text)
+        ok = got == expected
+        failures += not ok
+        print(f"  clean {'ok  ' if ok else 'FAIL'} {text!r} -> {got!r}" + ("" if ok else f" expected {expected!r}"))
+    return failures
+
+
+def check_merge():
+    """Known tooltip/hidden pairings: each must pick the right row and agree with
+    the old merge. Returns the number of failures."""
+    failures = 0
+    for label, tips, hidden, expected in _MERGE_CASES:
+        result = edugate._merge_sections(copy.deepcopy(tips), copy.deepcopy(hidden))
+        reference = _legacy_merge(copy.deepcopy(tips), copy.deepcopy(hidden))
+        got = {key: sec.get("time") for key, sec in result.items()}
+        ok = got == expected and not _merge_diffs(result, reference)
+        failures += not ok
+        print(f"  merge {'ok  ' if ok else 'FAIL'} {label}  got={got}")
+    return failures
+
+
+def bench_index(sections, rounds):
+    """Course filter: full scan per query vs one CourseIndex per snapshot."""
+    catalog = edugate.parse_sections(synthetic_catalog(sections))
+    codes = sorted({sec["course_code"] for sec in catalog.values()})
+    queries = codes[:: max(1, len(codes) // 50)] + [code.split()[0] for code in codes[:50]]
+    print(f"course filter, {len(catalog)} sections, {len(queries)} queries")
+    started = time.perf_counter()
+    index = edugate.CourseIndex(catalog)
+    print(f"  {'build CourseIndex':<30} {(time.perf_counter() - started) * 1000:8.1f} ms")
+    for label, fn in (
+        ("before: scan per query", lambda q: edugate.filter_sections_for_course(catalog, q)),
+        ("CourseIndex lookups", lambda q: index.filter(catalog, q)),
+    ):
+        best = None
+        for _ in range(rounds):
+            started = time.perf_counter()
+            results = [fn(q) for q in queries]
+            spent = time.perf_counter() - started
+            best = spent if best is None else min(best, spent)
+        print(f"  {label:<30} {best * 1000:8.1f} ms  matched={sum(map(len, results))}")
+
+
+def _md(text):
+    return str(text or "").replace("_", "\\_").replace("*", "\\*").replace("`", "\\`")
+
+
+def _legacy_listing(sections):
+    msg = ""
+    for code, info in sorted(edugate.group_by_course(list(sections.values())).items()):
+        msg += f"📚 *{_md(code)}* - {_md(info['name'])}\n"
+        for sec in info["sections"]:
+            msg += f"   • {_md(sec.get('section_num'))} `{_md(sec.get('section_id'))}` {_md(sec.get('doctor'))}\n"
+        msg += "\n"
+    return msg
+
+
+def bench_listing(sections, rounds):
+    """/sections rendering: build per request vs ListingCache (new version, then hits)."""
+    catalog = edugate.parse_sections(synthetic_catalog(sections))
+    index = edugate.CourseIndex(catalog)
+    codes = sorted({sec["course_code"] for sec in catalog.values()})
+    queries = [""] + codes[:: max(1, len(codes) // 20)]
+    line = lambda sec: (
+        f"   • {_md(sec.get('section_num'))} `{_md(sec.get('section_id'))}` {_md(sec.get('doctor'))}\n"
+    )
+    heading = lambda code, name: f"📚 *{_md(code)}* - {_md(name)}\n"
+    print(f"/sections listings, {len(catalog)} sections, {len(queries)} queries x {rounds} users")
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for q in queries:
+            _legacy_listing(index.filter(catalog, q) if q else catalog)
+    print(f"  {'before: render per request':<30} {(time.perf_counter() - started) * 1000:8.1f} ms")
+    cache = listings.ListingCache(line, heading)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for q in queries:
+            "".join(cache.get(1, catalog, q, index).blocks)
+    print(f"  {'ListingCache':<30} {(time.perf_counter() - started) * 1000:8.1f} ms  {cache.stats()}")
+
+
+def _timed(fn, html, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(html)
+        spent = time.perf_counter() - started
+        best = spent if best is None else min(best, spent)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("page", nargs="?", help="saved catalog HTML")
+    parser.add_argument("--synthetic", type=int, default=3000, help="sections if no page")
+    parser.add_argument("--merge", type=int, metavar="N", help="time only the merge on N sections")
+    parser.add_argument("--index", type=int, metavar="N", help="time course filtering on N sections")
+    parser.add_argument("--listing", type=int, metavar="N", help="time /sections rendering on N sections")
+    parser.add_argument("--check", action="store_true", help="run the known-case checks and exit")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.check:
+        failures = check_merge() + check_clean()
+        sys.exit(1 if failures else 0)
+
+    if args.merge:
+        bench_merge(args.merge, args.rounds)
+        return
+    if args.index:
+        bench_index(args.index, args.rounds)
+        return
+    if args.listing:
+        bench_listing(args.listing, args.rounds)
+        return
+
+    if args.page:
+        html = Path(args.page).read_text(encoding="utf-8", errors="replace")
+        label = args.page
+    else:
+        html = synthetic_catalog(args.synthetic)
+        label = f"synthetic {args.synthetic} sections"
+    print(f"{label}: {len(html) / 1024:.0f} KiB")
+
+    _check_clean(html)
+    reference = _legacy_two_trees(html)
+    print(f"  {'before: two html.parser trees':<30} {_timed(_legacy_two_trees, html, args.rounds):8.1f} ms")
+    for name in ("html.parser", "lxml"):
+        try:
+            BeautifulSoup("<p></p>", name)
+        except Exception:
+            print(f"  {'one ' + name + ' tree':<30} not installed")
+            continue
+        edugate._HTML_PARSER = name
+        _report(f"one {name} tree", lambda page: edugate.parse_sections(page, "tree"), html, reference, args.rounds)
+    _report("fast scanner, whole page", lambda page: edugate.parse_sections(page, "fast"), html, reference, args.rounds)
+    chunked = lambda page: edugate.parse_sections(
+        (page[i : i + 65536] for i in range(0, len(page), 65536)), "fast"
+    )
+    _report("fast scanner, 64 KiB chunks", chunked, html, reference, args.rounds)
+
+    incremental = edugate.IncrementalCatalogParser()
+    incremental.parse(html)
+    _report("incremental, same page", lambda page: incremental.parse(page)[0], html, reference, args.rounds)
+    pages = iter(_one_row_changed(html, i) for i in range(args.rounds + 1))
+    _report("incremental, one row changed", lambda _page: incremental.parse(next(pages))[0], html, None, args.rounds)
+
+
+def _one_row_changed(html, n):
+    """Same page with one tooltip row's first section id bumped."""
+    at = html.index("showToolTip(this,event,'", html.index("showToolTip") + n * 50)
+    ids_at = html.index("','-", at) + 4
+    return html[:ids_at] + str(90000 + n) + html[html.index("-", ids_at) :]
+
+
+def _report(label, fn, html, reference, rounds):
+    result = fn(html)
+    if reference is None:
+        same = ""
+    else:
+        same = "same" if result.keys() == reference.keys() and not _merge_diffs(result, reference) else "DIFFERS"
+    ms = _timed(fn, html, rounds)
+    print(f"  {label:<30} {ms:8.1f} ms  sections={len(result)} {same}")
+
+
+if __name__ == "__main__":
+    main()
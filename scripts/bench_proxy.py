@@ -0,0 +1,125 @@
+"""Throughput and CPU of each edugate_proxy data path over localhost sockets.
+
+    python scripts/bench_proxy.py
+    python scripts/bench_proxy.py --mb 500 --tunnels 4 --modes splice,buffer
+
+A local upstream sends --mb MB down every tunnel and the client reads it back
+through the proxy. The upstream and the clients run in a child process, so the
+CPU figure is the proxy loop's own thread time.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import edugate_proxy  # noqa: E402
+
+_CHUNK = 256 * 1024
+
+
+def _upstream(listener, total):
+    block = memoryview(os.urandom(_CHUNK))
+
+    def serve(conn):
+        with conn:
+            left = total
+            while left > 0:
+                sent = conn.send(block[: min(_CHUNK, left)])
+                left -= sent
+
+    while True:
+        conn, _addr = listener.accept()
+        threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+
+def _client(proxy_port, upstream_port, total, results):
+    sock = socket.create_connection(("127.0.0.1", proxy_port))
+    sock.sendall(f"CONNECT 127.0.0.1:{upstream_port} HTTP/1.1\r\n\r\n".encode())
+    head = b""
+    while b"\r\n\r\n" not in head:
+        head += sock.recv(1)
+    buf = bytearray(_CHUNK)
+    received = 0
+    while True:
+        got = sock.recv_into(buf)
+        if not got:
+            break
+        received += got
+    sock.close()
+    results.append(received == total)
+
+
+def _workload(listener, proxy_port, total, tunnels, done):
+    threading.Thread(target=_upstream, args=(listener, total), daemon=True).start()
+    results = []
+    clients = [
+        threading.Thread(target=_client, args=(proxy_port, listener.getsockname()[1], total, results))
+        for _ in range(tunnels)
+    ]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    done.put(all(results) and len(results) == tunnels)
+
+
+def bench(mode, total, tunnels):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(64)
+    edugate_proxy.ALLOW_HOSTS = {"127.0.0.1"}
+    edugate_proxy.ALLOW_PORTS = {listener.getsockname()[1]}
+    proxy = edugate_proxy.Proxy("127.0.0.1", 0, max_conns=tunnels + 4, drain=0, data_path_name=mode)
+    cpu = {}
+
+    def loop():
+        started = time.thread_time()
+        proxy.serve_forever()
+        cpu["s"] = time.thread_time() - started
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+    done = multiprocessing.Queue()
+    started = time.perf_counter()
+    child = multiprocessing.Process(
+        target=_workload, args=(listener, proxy.address[1], total, tunnels, done)
+    )
+    child.start()
+    ok = done.get()
+    elapsed = time.perf_counter() - started
+    child.terminate()
+    child.join()
+    proxy.stop()
+    thread.join()
+    listener.close()
+    mb = total * tunnels / 1e6
+    print(
+        f"  {mode:<8} {mb / elapsed:9.0f} MB/s  {cpu['s'] * 1000 / mb:7.2f} ms CPU/MB  "
+        f"{elapsed:6.2f} s  {'ok' if ok else 'SHORT READ'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=200, help="MB sent down each tunnel")
+    parser.add_argument("--tunnels", type=int, default=1)
+    parser.add_argument("--modes", default=",".join(edugate_proxy.DATA_PATHS))
+    args = parser.parse_args()
+    multiprocessing.set_start_method("fork")
+    print(f"{args.tunnels} tunnel(s) x {args.mb} MB through the proxy")
+    for mode in args.modes.split(","):
+        if mode not in edugate_proxy.DATA_PATHS:
+            print(f"  {mode:<8} not available here")
+            continue
+        bench(mode, args.mb * 1_000_000, args.tunnels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Replay-order checks for the per-chat catalog cursors, with no Telegram or Edugate.
+
+    python scripts/check_cursors.py
+
+A snapshot older than a chat's cursor (a cycle tick or a stale cached catalog
+arriving after /check moved the chat on) must neither alert nor move the
+cursor back, and the next newer snapshot must alert exactly once. Exits 1 on
+a failure.
+"""
+import copy
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+_DATA = tempfile.mkdtemp(prefix="check_cursors_")
+for _name, _value in (
+    ("BOT_TOKEN", "0:check"),
+    ("ADMIN_ID", "0"),
+    ("EDUGATE_USERNAME", "check"),
+    ("EDUGATE_PASSWORD", "check"),
+):
+    os.environ.setdefault(_name, _value)
+os.environ.update(
+    USERS_FILE=f"{_DATA}/users.json",
+    CATALOG_DIR=f"{_DATA}/catalog",
+    SESSION_FILE=f"{_DATA}/session.json",
+    DIGEST_WINDOW="0",
+)
+
+import edugate  # noqa: E402
+
+
+class _NoEdugate:
+    """Stands in for EdugateClient; every snapshot is passed in explicitly."""
+
+    def fetch_catalog(self, force=False):
+        return {}, "unused"
+
+    def backoff_remaining(self):
+        return 0
+
+    def consume_busy_alert(self):
+        return False
+
+
+edugate.EdugateClient = _NoEdugate
+
+import bot  # noqa: E402
+
+_sent = []
+bot.outbox.enqueue = lambda chat_id, text, **kwargs: _sent.append((chat_id, text))
+
+
+def _section(course_id, section_id, code="101 CS"):
+    return {
+        "course_id": course_id,
+        "course_code": code,
+        "course_name": "Intro",
+        "section_num": "1",
+        "section_id": section_id,
+        "doctor": "A",
+        "activity": "",
+        "time": "",
+        "group": "",
+    }
+
+
+def _snapshot(*sections):
+    catalog = edugate._fingerprinted(
+        {f"{sec['course_id']}_{sec['section_id']}": copy.deepcopy(sec) for sec in sections}
+    )
+    return bot.catalog.put(catalog), catalog, None
+
+
+def _alerts(chat_id):
+    count = sum(1 for sent_to, _text in _sent if sent_to == chat_id)
+    _sent.clear()
+    return count
+
+
+def check(label, ok):
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}")
+    return not ok
+
+
+def main():
+    failures = 0
+    a, b, c = _section("1", "10"), _section("1", "11"), _section("1", "12")
+    v1 = _snapshot(a)
+    v2 = _snapshot(a, b)
+    v3 = _snapshot(a, b, c)
+
+    for chat_id, courses, cursor_key in ((1, [], "catalog_version"), (2, ["101 CS"], "course_version")):
+        scope = "course" if courses else "catalog"
+        bot.save_user(chat_id, {"course_watches": courses, "watches": {}})
+        bot.check_user_sections(chat_id, snapshot=v1)
+        _alerts(chat_id)
+        bot.check_user_sections(chat_id, snapshot=v2)
+        failures += check(f"{scope}: newer snapshot alerts", _alerts(chat_id) == 1)
+        bot.check_user_sections(chat_id, snapshot=v1)
+        user = bot.get_user(chat_id)
+        failures += check(f"{scope}: older snapshot is silent", _alerts(chat_id) == 0)
+        failures += check(f"{scope}: older snapshot keeps the cursor", user[cursor_key] == v2[0])
+        bot.check_user_sections(chat_id, snapshot=v2)
+        failures += check(f"{scope}: same snapshot again is silent", _alerts(chat_id) == 0)
+        bot.check_user_sections(chat_id, snapshot=v3)
+        failures += check(f"{scope}: next newer snapshot alerts once", _alerts(chat_id) == 1)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Per-chat user storage: JSON file or SQLite (WAL), behind an in-memory registry."""
+import atexit
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import config
+
+log = logging.getLogger("storage")
+
+# Keys that get their own child table in SQLite; everything else is a row column blob.
+_CHILD_KEYS = ("watches", "course_watches", "sections", "course_snapshots")
+_SECRET_KEYS = ("username", "password")
+
+
+def _without_secrets(user_data):
+    return {k: v for k, v in user_data.items() if k not in _SECRET_KEYS}
+
+
+class JsonUserStore:
+    """Legacy single-file store. A batch rewrites users.json via temp + rename."""
+
+    name = "json"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._users = None
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                users = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return {uid: _without_secrets(data) for uid, data in users.items()}
+
+    def _write(self, users):
+        cleaned = {uid: _without_secrets(data) for uid, data in users.items()}
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cleaned, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def load_all(self):
+        with self._lock:
+            self._users = self._read()
+            return dict(self._users)
+
+    def write_batch(self, changes):
+        with self._lock:
+            if self._users is None:
+                self._users = self._read()
+            for chat_id, user_data in changes.items():
+                if user_data is None:
+                    self._users.pop(str(chat_id), None)
+                else:
+                    self._users[str(chat_id)] = user_data
+            self._write(self._users)
+
+    def close(self):
+        pass
+
+
+class SqliteUserStore:
+    """One row per chat plus child tables, so a save touches one chat only."""
+
+    name = "sqlite"
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        chat_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS watches (
+        chat_id TEXT NOT NULL,
+        section_id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (chat_id, section_id)
+    );
+    CREATE TABLE IF NOT EXISTS course_watches (
+        chat_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        query TEXT NOT NULL,
+        PRIMARY KEY (chat_id, position)
+    );
+    CREATE TABLE IF NOT EXISTS snapshots (
+        chat_id TEXT NOT NULL,
+        scope TEXT NOT NULL,
+        section_key TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (chat_id, scope, section_key)
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """
+
+    # snapshots.scope: "" for a legacy per-chat catalog copy, else the course
+    # watch key. Course rows only record which section keys were seen.
+    _CATALOG_SCOPE = ""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self._SCHEMA)
+        self._db.commit()
+
+    def is_empty(self):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+            )
+
+    def _children(self):
+        watches = {}
+        for chat_id, section_id, data in self._db.execute(
+            "SELECT chat_id, section_id, data FROM watches"
+        ):
+            watches.setdefault(chat_id, {})[section_id] = json.loads(data)
+        course_watches = {}
+        for chat_id, query in self._db.execute(
+            "SELECT chat_id, query FROM course_watches ORDER BY chat_id, position"
+        ):
+            course_watches.setdefault(chat_id, []).append(query)
+        sections = {}
+        course_snapshots = {}
+        for chat_id, scope, section_key, data in self._db.execute(
+            "SELECT chat_id, scope, section_key, data FROM snapshots "
+            "ORDER BY chat_id, scope, section_key"
+        ):
+            if scope == self._CATALOG_SCOPE:
+                sections.setdefault(chat_id, {})[section_key] = json.loads(data)
+            else:
+                course_snapshots.setdefault(chat_id, {}).setdefault(scope, []).append(section_key)
+        return watches, course_watches, sections, course_snapshots
+
+    def _assemble(self, rows):
+        watches, course_watches, sections, course_snapshots = self._children()
+        users = {}
+        for chat_id, data in rows:
+            user = json.loads(data)
+            if chat_id in sections:
+                user["sections"] = sections[chat_id]
+            user["watches"] = watches.get(chat_id, {})
+            user["course_watches"] = course_watches.get(chat_id, [])
+            user["course_snapshots"] = course_snapshots.get(chat_id, {})
+            users[chat_id] = user
+        return users
+
+    def load_all(self):
+        with self._lock:
+            rows = self._db.execute("SELECT chat_id, data FROM users").fetchall()
+            return self._assemble(rows)
+
+    def _delete_rows(self, chat_id):
+        for table in ("users", "watches", "course_watches", "snapshots"):
+            self._db.execute(f"DELETE FROM {table} WHERE chat_id = ?", (chat_id,))
+
+    def _insert_rows(self, chat_id, user_data):
+        user_data = _without_secrets(user_data)
+        row = {k: v for k, v in user_data.items() if k not in _CHILD_KEYS}
+        self._db.execute(
+            "INSERT INTO users (chat_id, data) VALUES (?, ?)",
+            (chat_id, json.dumps(row, ensure_ascii=False)),
+        )
+        self._db.executemany(
+            "INSERT INTO watches (chat_id, section_id, data) VALUES (?, ?, ?)",
+            [
+                (chat_id, str(section_id), json.dumps(sec, ensure_ascii=False))
+                for section_id, sec in (user_data.get("watches") or {}).items()
+            ],
+        )
+        self._db.executemany(
+            "INSERT INTO course_watches (chat_id, position, query) VALUES (?, ?, ?)",
+            [
+                (chat_id, pos, query)
+                for pos, query in enumerate(user_data.get("course_watches") or [])
+            ],
+        )
+        snapshot_rows = [
+            (chat_id, self._CATALOG_SCOPE, key, json.dumps(sec, ensure_ascii=False))
+            for key, sec in (user_data.get("sections") or {}).items()
+        ]
+        for scope, keys in (user_data.get("course_snapshots") or {}).items():
+            snapshot_rows.extend((chat_id, scope, key, "null") for key in keys or ())
+        self._db.executemany(
+            "INSERT INTO snapshots (chat_id, scope, section_key, data) VALUES (?, ?, ?, ?)",
+            snapshot_rows,
+        )
+
+    def write_batch(self, changes):
+        """Apply {chat_id: data or None} in one transaction."""
+        with self._lock, self._db:
+            for chat_id, user_data in changes.items():
+                self._delete_rows(str(chat_id))
+                if user_data is not None:
+                    self._insert_rows(str(chat_id), user_data)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class UserRegistry:
+    """In-memory chats loaded once; saves mark a chat dirty and flush in batches.
+
+    get() hands out a private copy, so callers can edit it and pass it back
+    to save(). Stored records are never edited in place.
+    """
+
+    def __init__(self, store, flush_interval):
+        self._store = store
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._users = store.load_all()
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="users-flush", daemon=True)
+        self._thread.start()
+
+    @property
+    def name(self):
+        return self._store.name
+
+    def all(self):
+        """Shallow per-chat copies for read-only scans."""
+        with self._lock:
+            return {uid: dict(data) for uid, data in self._users.items()}
+
+    def get(self, chat_id):
+        with self._lock:
+            user = self._users.get(str(chat_id))
+        return copy.deepcopy(user) if user is not None else None
+
+    def save(self, chat_id, user_data):
+        with self._lock:
+            self._users[str(chat_id)] = user_data
+            self._dirty.add(str(chat_id))
+
+    def delete(self, chat_id):
+        with self._lock:
+            if self._users.pop(str(chat_id), None) is None:
+                return False
+            self._dirty.add(str(chat_id))
+            return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        """Write every dirty chat in one batch. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                changes = {uid: self._users.get(uid) for uid in self._dirty}
+                self._dirty = set()
+            started = time.time()
+            try:
+                self._store.write_batch(changes)
+            except Exception:
+                with self._lock:
+                    self._dirty.update(changes)
+                log.exception("flush fail  chats=%s", len(changes))
+                return 0
+            log.info(
+                "flush ok  store=%s chats=%s ms=%s",
+                self._store.name,
+                len(changes),
+                int((time.time() - started) * 1000),
+            )
+            return len(changes)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        self._store.close()
+
+
+# meta key set once users.json has been imported (or found unnecessary), so a
+# database emptied by logouts is not refilled from the old file on restart.
+_IMPORTED_KEY = "json_imported"
+
+
+def migrate_json(json_path, store):
+    """Copy every chat from users.json into store. Returns the chat count."""
+    users = JsonUserStore(json_path).load_all()
+    if users:
+        store.write_batch(users)
+    store.set_meta(_IMPORTED_KEY, int(time.time()))
+    log.info("migrate  from=%s chats=%s", json_path, len(users))
+    return len(users)
+
+
+def open_store():
+    """Build the backend picked by USER_STORE; first SQLite start imports users.json."""
+    if config.USER_STORE == "json":
+        return JsonUserStore(config.USERS_FILE)
+    store = SqliteUserStore(config.USERS_DB)
+    if store.get_meta(_IMPORTED_KEY) is None:
+        if store.is_empty() and Path(config.USERS_FILE).is_file():
+            migrate_json(config.USERS_FILE, store)
+        else:
+            store.set_meta(_IMPORTED_KEY, int(time.time()))
+    return store
+
+
+def open_registry():
+    """Load every chat once and flush changes behind the scenes until exit."""
+    registry = UserRegistry(open_store(), config.USERS_FLUSH_INTERVAL)
+    atexit.register(registry.close)
+    return registry
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="One-shot users.json -> SQLite import")
+    parser.add_argument("source", nargs="?", default=config.USERS_FILE)
+    parser.add_argument("--db", default=config.USERS_DB)
+    args = parser.parse_args()
+    store = SqliteUserStore(args.db)
+    count = migrate_json(args.source, store)
+    store.close()
+    print(f"imported {count} chats from {args.source} into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Telegram webhook receiver: a small HTTP server feeding a bounded worker pool."""
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot.types import Update
+
+log = logging.getLogger("webhook")
+
+# Updates are at most a few KB; anything far bigger is not from Telegram.
+_MAX_BODY = 1 << 20
+
+
+def _update_chat(update):
+    """Chat id an update belongs to, so one chat's updates stay on one worker."""
+    for name in ("message", "edited_message", "channel_post", "callback_query", "my_chat_member"):
+        item = getattr(update, name, None)
+        if item is None:
+            continue
+        message = getattr(item, "message", None) or item
+        chat = getattr(message, "chat", None)
+        if chat is not None:
+            return chat.id
+        sender = getattr(item, "from_user", None)
+        if sender is not None:
+            return sender.id
+    return update.update_id
+
+
+class WebhookServer:
+    """POSTs to `path` carrying the secret header are handed to `dispatch([update])`
+    on one of `workers` threads.
+
+    Each request is read on its own thread, so a slow or stalled connection
+    does not hold up the others; handlers never run there. Each worker has its
+    own queue of `backlog // workers` updates and a chat always maps to the
+    same worker, so a chat's updates run in order. A full queue answers 503
+    and Telegram delivers the update again later; nothing waits in the HTTP
+    threads.
+    """
+
+    def __init__(self, dispatch, listen, port, path, secret, workers=8, backlog=256):
+        self._dispatch = dispatch
+        self._path = path
+        self._secret = secret.encode("utf-8")
+        self._queues = [
+            queue.Queue(maxsize=max(1, backlog // max(1, workers))) for _ in range(max(1, workers))
+        ]
+        self._stats_lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.handled = 0
+        self._server = ThreadingHTTPServer((listen, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._server.timeout = 10
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queued": sum(q.qsize() for q in self._queues),
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "handled": self.handled,
+            }
+
+    def offer(self, payload):
+        """Queue one decoded update; False when its worker is full."""
+        update = Update.de_json(payload)
+        worker = self._queues[hash(_update_chat(update)) % len(self._queues)]
+        try:
+            worker.put_nowait((time.time(), update))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+        with self._stats_lock:
+            self.accepted += 1
+        return True
+
+    def _work(self, updates):
+        while True:
+            queued_at, update = updates.get()
+            try:
+                self._dispatch([update])
+            except Exception:
+                log.exception("update crash  id=%s", update.update_id)
+            with self._stats_lock:
+                self.handled += 1
+            log.info(
+                "update done  id=%s wait_ms=%s backlog=%s",
+                update.update_id,
+                int((time.time() - queued_at) * 1000),
+                updates.qsize(),
+            )
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            timeout = 10
+
+            def do_POST(self):
+                if self.path != server._path:
+                    self._reply(404)
+                    return
+                token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode("utf-8")
+                if not hmac.compare_digest(token, server._secret):
+                    log.warning("webhook reject  reason=secret peer=%s", self.client_address[0])
+                    self._reply(403)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                except ValueError:
+                    length = -1
+                if not 0 < length <= _MAX_BODY:
+                    self._reply(400)
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(length))
+                    if not isinstance(payload, dict):
+                        raise ValueError("update is not an object")
+                    accepted = server.offer(payload)
+                except (ValueError, KeyError, TypeError):
+                    self._reply(400)
+                    return
+                if not accepted:
+                    log.warning("webhook busy  update=%s", payload.get("update_id"))
+                    self._reply(503)
+                    return
+                self._reply(200)
+
+            def _reply(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        for number, updates in enumerate(self._queues):
+            threading.Thread(
+                target=self._work, args=(updates,), name=f"webhook-{number}", daemon=True
+            ).start()
+        log.info(
+            "webhook listening  addr=%s:%s path=%s workers=%s",
+            *self.address,
+            self._path,
+            len(self._queues),
+        )
+        self._server.serve_forever()
+
+    def shutdown(self):
+        self._server.shutdown()